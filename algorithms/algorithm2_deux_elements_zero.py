@@ -1,15 +1,26 @@
+import heapq
+import os
+import tempfile
+from bisect import bisect_left
+
+try:
+    import numpy as np
+except ImportError:  # modes vectorisé et fichier indisponibles sans NumPy
+    np = None
+
+
 def deux_elements_proche_zero(arr):
     """
     Trouve deux éléments dont la somme est la plus proche de zéro
-    Input: tableau d'entiers
+    Input: tableau d'entiers (non modifié)
     Output: tuple des deux éléments
     """
     n = len(arr)
     if n < 2:
         return None
     
-    # Trier le tableau pour optimiser la recherche
-    arr.sort()
+    # Trier une copie pour optimiser la recherche sans modifier l'entrée
+    arr = sorted(arr)
     
     left = 0
     right = n - 1
@@ -33,10 +44,208 @@ def deux_elements_proche_zero(arr):
     
     return result
 
+
+def k_paires_proches_zero(arr, k):
+    """
+    Généralisation: les k paires dont la somme est la plus proche de zéro
+    Input: tableau d'entiers (non modifié), nombre de paires k
+    Output: liste d'au plus k tuples (plus petit, plus grand), de la
+    meilleure à la moins bonne; deux paires diffèrent par leurs positions
+    """
+    valeurs = sorted(arr)
+    n = len(valeurs)
+
+    # Pour chaque i, les partenaires j > i s'éloignent de -valeurs[i] dans
+    # deux directions, où |somme| ne fait que croître: deux fronts par i
+    tas = []
+    for i in range(n - 1):
+        centre = bisect_left(valeurs, -valeurs[i], i + 1)
+        if centre < n:
+            tas.append((abs(valeurs[i] + valeurs[centre]), i, centre, 1))
+        if centre - 1 > i:
+            tas.append((abs(valeurs[i] + valeurs[centre - 1]), i, centre - 1, -1))
+    heapq.heapify(tas)
+
+    paires = []
+    while tas and len(paires) < k:
+        _, i, j, pas = heapq.heappop(tas)
+        paires.append((valeurs[i], valeurs[j]))
+        j += pas
+        if i < j < n:
+            heapq.heappush(tas, (abs(valeurs[i] + valeurs[j]), i, j, pas))
+    return paires
+
+
+# --- Modes NumPy --------------------------------------------------------------
+#
+# Dans l'ordre des valeurs absolues croissantes, la meilleure paire est
+# toujours formée de deux voisins: entre deux éléments de signes opposés, un
+# voisin intermédiaire donne une somme au moins aussi proche de zéro, et deux
+# éléments de même signe ne battent jamais les deux plus petits en valeur
+# absolue. Un tri puis une comparaison des voisins suffisent donc, ce qui se
+# vectorise et se fait en flux.
+#
+# Les sommes sont calculées dans le type des données: en int64, les valeurs
+# doivent rester sous 2**62 en valeur absolue.
+
+def _numpy():
+    if np is None:
+        raise ImportError('NumPy est requis pour ce mode (pip install numpy)')
+    return np
+
+
+def _cle_absolue(valeurs):
+    """Valeurs absolues en entiers non signés, exactes même pour le minimum int64"""
+    cle = valeurs.astype(np.uint64)
+    negatifs = valeurs < 0
+    cle[negatifs] = np.uint64(0) - cle[negatifs]
+    return cle
+
+
+def deux_elements_proche_zero_lot(tableaux, longueurs=None):
+    """
+    Version vectorisée de deux_elements_proche_zero pour de nombreux tableaux
+    Input: tableau 2D (m, n), séquence de m tableaux de longueurs quelconques,
+    ou tableau 1D de toutes les valeurs concaténées avec leurs longueurs
+    Output: (paires, valides): paires de forme (m, 2), une ligne
+    (plus petit, plus grand) par tableau; valides[i] est faux si le tableau i
+    a moins de deux éléments (sa ligne vaut alors 0)
+    Les entrées ne sont pas modifiées. À égalité, la paire retenue peut
+    différer de celle de deux_elements_proche_zero.
+    """
+    np = _numpy()
+
+    if longueurs is None and isinstance(tableaux, np.ndarray) and tableaux.ndim == 2:
+        # Longueur commune: tri et recherche ligne par ligne, sans boucle Python
+        m, n = tableaux.shape
+        if n < 2:
+            return np.zeros((m, 2), dtype=tableaux.dtype), np.zeros(m, dtype=bool)
+        ordre = np.argsort(_cle_absolue(tableaux), axis=1, kind='stable')
+        tries = np.take_along_axis(tableaux, ordre, axis=1)
+        meilleurs = np.argmin(np.abs(tries[:, 1:] + tries[:, :-1]), axis=1)
+        lignes = np.arange(m)
+        a = tries[lignes, meilleurs]
+        b = tries[lignes, meilleurs + 1]
+        return np.stack([np.minimum(a, b), np.maximum(a, b)], axis=1), np.ones(m, dtype=bool)
+
+    if longueurs is None:
+        tableaux = [np.asarray(t) for t in tableaux]
+        longueurs = [len(t) for t in tableaux]
+        valeurs = np.concatenate(tableaux) if tableaux else np.empty(0, dtype=np.int64)
+    else:
+        valeurs = np.asarray(tableaux)
+    longueurs = np.asarray(longueurs, dtype=np.intp)
+    m = len(longueurs)
+
+    # Tri global par (tableau, valeur absolue), puis voisins d'un même tableau
+    lignes = np.repeat(np.arange(m), longueurs)
+    ordre = np.lexsort((_cle_absolue(valeurs), lignes))
+    tries = valeurs[ordre]
+    lignes = lignes[ordre]
+    voisins = np.flatnonzero(lignes[1:] == lignes[:-1])
+    sommes = np.abs(tries[voisins] + tries[voisins + 1])
+
+    # Meilleure paire de chaque tableau: premier voisin après tri par |somme|
+    voisins = voisins[np.lexsort((sommes, lignes[voisins]))]
+    lignes_voisins = lignes[voisins]
+    premiers = np.ones(len(voisins), dtype=bool)
+    premiers[1:] = lignes_voisins[1:] != lignes_voisins[:-1]
+    choisis = voisins[premiers]
+
+    a = tries[choisis]
+    b = tries[choisis + 1]
+    paires = np.zeros((m, 2), dtype=valeurs.dtype)
+    valides = np.zeros(m, dtype=bool)
+    paires[lignes[choisis]] = np.stack([np.minimum(a, b), np.maximum(a, b)], axis=1)
+    valides[lignes[choisis]] = True
+    return paires, valides
+
+
+def _fusion(chemins, dtype, taille_lecture):
+    """Fusionne des fichiers triés par valeur absolue, par lots triés.
+
+    Chaque lot contient toutes les valeurs restantes dont la clé ne dépasse
+    pas la plus petite dernière clé des tampons: aucune valeur plus petite
+    ne peut plus arriver d'un autre fichier.
+    """
+    fichiers = [open(chemin, 'rb') for chemin in chemins]
+    try:
+        tampons = [np.fromfile(f, dtype=dtype, count=taille_lecture) for f in fichiers]
+        while True:
+            actifs = [i for i, tampon in enumerate(tampons) if tampon.size]
+            if not actifs:
+                return
+            borne = min(_cle_absolue(tampons[i][-1:])[0] for i in actifs)
+
+            parties = []
+            for i in actifs:
+                coupure = np.searchsorted(_cle_absolue(tampons[i]), borne, side='right')
+                parties.append(tampons[i][:coupure])
+                tampons[i] = tampons[i][coupure:]
+                if not tampons[i].size:
+                    tampons[i] = np.fromfile(fichiers[i], dtype=dtype, count=taille_lecture)
+            lot = np.concatenate(parties)
+            yield lot[np.argsort(_cle_absolue(lot), kind='stable')]
+    finally:
+        for f in fichiers:
+            f.close()
+
+
+def deux_elements_proche_zero_fichier(chemin, dtype='<i8', taille_bloc=1 << 22, dossier_temp=None):
+    """
+    Version en flux pour un fichier d'entiers trop grand pour la mémoire
+    Input: fichier binaire d'entiers bruts de type dtype (ex. écrit par
+    ndarray.tofile), taille_bloc = nombre de valeurs triées en mémoire
+    Output: tuple (plus petit, plus grand), ou None si moins de deux entiers
+    Tri externe: chaque bloc est trié par valeur absolue dans un fichier
+    temporaire, puis les blocs sont fusionnés et la meilleure paire cherchée
+    parmi les voisins de l'ordre global. Environ 2 x taille_bloc valeurs
+    sont en mémoire à la fois.
+    """
+    np = _numpy()
+    with tempfile.TemporaryDirectory(dir=dossier_temp) as dossier:
+        blocs = []
+        with open(chemin, 'rb') as f:
+            while True:
+                bloc = np.fromfile(f, dtype=dtype, count=taille_bloc)
+                if not bloc.size:
+                    break
+                chemin_bloc = os.path.join(dossier, f'bloc{len(blocs)}.bin')
+                bloc[np.argsort(_cle_absolue(bloc), kind='stable')].tofile(chemin_bloc)
+                blocs.append(chemin_bloc)
+
+        result = None
+        min_abs = None
+        precedent = None
+        taille_lecture = max(1, taille_bloc // max(1, len(blocs)))
+        for lot in _fusion(blocs, dtype, taille_lecture):
+            # Le dernier élément du lot précédent est le voisin du premier
+            if precedent is not None:
+                lot = np.concatenate([precedent, lot])
+            precedent = lot[-1:]
+            if lot.size < 2:
+                continue
+            sommes = np.abs(lot[1:] + lot[:-1])
+            k = int(np.argmin(sommes))
+            if min_abs is None or sommes[k] < min_abs:
+                min_abs = sommes[k]
+                a, b = int(lot[k]), int(lot[k + 1])
+                result = (min(a, b), max(a, b))
+    return result
+
 # Test de l'algorithme
 if __name__ == "__main__":
     print("=== ALGORITHME 2: Deux éléments dont la somme est proche de zéro ===")
     arr = [1, 60, -10, 70, -80, 85]
     print(f"Input: {arr}")
     resultat = deux_elements_proche_zero(arr)
-    print(f"Output: {resultat[0]} et {resultat[1]}")
\ No newline at end of file
+    print(f"Output: {resultat[0]} et {resultat[1]}")
+    print(f"Input inchangé: {arr}")
+    print(f"3 meilleures paires: {k_paires_proches_zero(arr, 3)}")
+
+    if np is not None:
+        paires, valides = deux_elements_proche_zero_lot([arr, [5, -3], [7]])
+        print(f"Lot: {paires.tolist()} (valides: {valides.tolist()})")
+        with tempfile.NamedTemporaryFile(suffix='.bin') as fichier:
+            np.array(arr, dtype='<i8').tofile(fichier.name)
+            print(f"Fichier: {deux_elements_proche_zero_fichier(fichier.name, taille_bloc=2)}")
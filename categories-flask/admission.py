@@ -0,0 +1,221 @@
+"""Contrôle d'admission: limites de concurrence par route et délestage.
+
+Chaque requête prend une place avant d'exécuter sa vue. Une place est libre
+si la route n'a pas atteint sa limite (limits, sinon default_limit) et si le
+processus n'a pas atteint max_concurrency requêtes en cours. Une lecture
+n'entre que s'il reste moins de max_concurrency - write_reserved requêtes en
+cours (lectures et écritures confondues): les dernières places sont réservées
+aux écritures, qui passent aussi en tête de la file d'attente.
+Les lectures ne peuvent donc pas affamer les écritures.
+
+Sans place libre, la requête attend dans une file bornée (queue_size) au plus
+queue_timeout secondes. File pleine ou délai expiré: réponse 503 immédiate
+avec Retry-After, plutôt qu'un empilement qui ralentit toutes les routes.
+
+Les limites s'appliquent par processus (par worker de serve.py); max_concurrency
+est plafonné à la taille du pool de lecture (SQLITE_READ_POOL_SIZE).
+"""
+import math
+import threading
+import time
+from collections import Counter
+from flask import g, jsonify, request
+from instrumentation import escape_label
+
+# Routes d'écriture servies en GET
+WRITE_ENDPOINTS = ('delete_category', 'delete_product')
+# Jamais limitées: la supervision doit rester disponible sous charge
+EXEMPT_ENDPOINTS = ('metrics', 'static')
+
+
+class Overloaded(Exception):
+    """Requête refusée: file pleine ou délai d'attente expiré"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ('route', 'limit', 'write')
+
+    def __init__(self, route, limit, write):
+        self.route = route
+        self.limit = limit
+        self.write = write
+
+
+class AdmissionController:
+    """Places de concurrence par route, avec file prioritaire pour les écritures"""
+
+    def __init__(self, max_concurrency=16, write_reserved=2, limits=None, default_limit=None,
+                 queue_size=64, queue_timeout=0.5):
+        self.max_concurrency = max_concurrency
+        self.write_reserved = min(write_reserved, max_concurrency - 1)
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit or max_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = Counter()
+        self._reads = 0
+        self._writes = 0
+        # Files d'attente par priorité: écritures d'abord, puis lectures
+        self._queues = {True: [], False: []}
+        self.admitted = Counter()
+        self.shed = Counter()
+        self.wait_time = 0.0
+
+    def limit(self, route):
+        return self.limits.get(route, self.default_limit)
+
+    def _has_room(self, route, limit, write):
+        if self._active[route] >= limit:
+            return False
+        running = self._reads + self._writes
+        if write:
+            return running < self.max_concurrency
+        # Les écritures en cours occupent aussi des places (et une connexion)
+        return running < self.max_concurrency - self.write_reserved
+
+    def _next_admissible(self, write):
+        # Premier en attente pouvant passer: écritures d'abord, et une écriture
+        # ne cède jamais la priorité à une lecture
+        for lane in ((True,) if write else (True, False)):
+            for waiter in self._queues[lane]:
+                if self._has_room(waiter.route, waiter.limit, waiter.write):
+                    return waiter
+        return None
+
+    def _take(self, route, write):
+        self._active[route] += 1
+        if write:
+            self._writes += 1
+        else:
+            self._reads += 1
+        self.admitted['write' if write else 'read'] += 1
+
+    def acquire(self, route, write=False):
+        """Réserve une place pour route; lève Overloaded si la requête est délestée"""
+        limit = self.limit(route)
+        with self._cond:
+            # Les requêtes en attente d'une autre route saturée ne bloquent pas
+            if self._has_room(route, limit, write) and self._next_admissible(write) is None:
+                self._take(route, write)
+                return
+            if len(self._queues[True]) + len(self._queues[False]) >= self.queue_size:
+                self.shed[(route, 'queue_full')] += 1
+                raise Overloaded('queue_full')
+
+            waiter = _Waiter(route, limit, write)
+            queue = self._queues[write]
+            queue.append(waiter)
+            start = time.monotonic()
+            try:
+                admitted = self._cond.wait_for(
+                    lambda: self._next_admissible(write) is waiter, self.queue_timeout)
+            finally:
+                queue.remove(waiter)
+                self.wait_time += time.monotonic() - start
+            if not admitted:
+                self.shed[(route, 'timeout')] += 1
+                # Le départ de ce client peut débloquer un suivant
+                self._cond.notify_all()
+                raise Overloaded('timeout')
+            self._take(route, write)
+
+    def release(self, route, write=False):
+        with self._cond:
+            self._active[route] -= 1
+            if not self._active[route]:
+                del self._active[route]
+            if write:
+                self._writes -= 1
+            else:
+                self._reads -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': dict(self._active),
+                'reads': self._reads,
+                'writes': self._writes,
+                'queued': {'write': len(self._queues[True]), 'read': len(self._queues[False])},
+                'admitted': dict(self.admitted),
+                'shed': {f'{route} {reason}': count
+                         for (route, reason), count in self.shed.items()},
+            }
+
+    def metric_lines(self):
+        """Requêtes actives, files d'attente et délestages, pour /metrics"""
+        with self._cond:
+            active = dict(self._active)
+            queued = {'write': len(self._queues[True]), 'read': len(self._queues[False])}
+            admitted = dict(self.admitted)
+            shed = dict(self.shed)
+            wait_time = self.wait_time
+        lines = ['# TYPE admission_active_requests gauge']
+        lines += [f'admission_active_requests{{route="{escape_label(route)}"}} {count}'
+                  for route, count in sorted(active.items())]
+        lines.append('# TYPE admission_queue_depth gauge')
+        lines += [f'admission_queue_depth{{lane="{lane}"}} {count}'
+                  for lane, count in queued.items()]
+        lines.append('# TYPE admission_admitted_total counter')
+        lines += [f'admission_admitted_total{{lane="{lane}"}} {count}'
+                  for lane, count in sorted(admitted.items())]
+        lines.append('# TYPE admission_shed_total counter')
+        lines += [f'admission_shed_total{{route="{escape_label(route)}",reason="{reason}"}} {count}'
+                  for (route, reason), count in sorted(shed.items())]
+        lines += ['# TYPE admission_queue_wait_seconds_total counter',
+                  f'admission_queue_wait_seconds_total {wait_time:.6f}']
+        return lines
+
+
+def init_admission(app):
+    """Active le contrôle d'admission si app.config['ADMISSION_CONTROL'] est vrai"""
+    if not app.config.get('ADMISSION_CONTROL', False):
+        return None
+
+    # Chaque requête admise emprunte une connexion de lecture (synchronisation
+    # de l'index): au-delà de la taille du pool, elle attendrait le pool
+    pool_size = app.config.get('SQLITE_READ_POOL_SIZE', 8)
+    controller = AdmissionController(
+        max_concurrency=min(app.config.get('ADMISSION_MAX_CONCURRENCY', pool_size), pool_size),
+        write_reserved=app.config.get('ADMISSION_WRITE_RESERVED', 2),
+        limits=app.config.get('ADMISSION_LIMITS'),
+        default_limit=app.config.get('ADMISSION_DEFAULT_LIMIT'),
+        queue_size=app.config.get('ADMISSION_QUEUE_SIZE', 64),
+        queue_timeout=app.config.get('ADMISSION_QUEUE_TIMEOUT', 0.5),
+    )
+    retry_after = str(math.ceil(app.config.get('ADMISSION_RETRY_AFTER', 1)))
+    write_endpoints = set(app.config.get('ADMISSION_WRITE_ENDPOINTS', WRITE_ENDPOINTS))
+    exempt = set(app.config.get('ADMISSION_EXEMPT', EXEMPT_ENDPOINTS))
+
+    def _admit():
+        if request.url_rule is None or request.endpoint in exempt:
+            return None
+        route = request.url_rule.rule
+        write = request.method not in ('GET', 'HEAD', 'OPTIONS') or request.endpoint in write_endpoints
+        try:
+            controller.acquire(route, write)
+        except Overloaded as e:
+            response = jsonify({'error': 'Service surchargé, réessayez plus tard',
+                                'reason': e.reason})
+            response.status_code = 503
+            response.headers['Retry-After'] = retry_after
+            return response
+        g._admission = (route, write)
+        return None
+
+    # Avant tout autre hook (dont la synchronisation de l'index, qui prend
+    # une connexion du pool): une requête délestée ne touche pas à SQLite
+    app.before_request_funcs.setdefault(None, []).insert(0, _admit)
+
+    @app.teardown_request
+    def _release(exc=None):
+        admission = g.pop('_admission', None)
+        if admission is not None:
+            controller.release(*admission)
+
+    return controller
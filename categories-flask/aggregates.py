@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import threading
+from database import bump_catalog_version
+
+logger = logging.getLogger('categories.aggregates')
+
+
+class AggregationWorker:
+    """Maintenance des compteurs product_count par un thread d'arrière-plan.
+
+    Les routes d'écriture signalent après commit les catégories dont les
+    produits ont changé (mark_dirty). Le worker regroupe les signalements
+    reçus pendant `delay` secondes, puis recalcule dans une seule transaction
+    les compteurs de ces catégories et de leurs ancêtres, du plus profond au
+    plus haut: compteur = produits directs + somme des compteurs des enfants.
+    Le recalcul est exact et idempotent, plusieurs processus peuvent donc
+    traiter les mêmes catégories sans dérive.
+
+    Désactivé (enabled=False), mark_dirty et flush ne font rien: les routes
+    appliquent alors les deltas dans leur propre transaction.
+    """
+
+    def __init__(self, connect, enabled=False, delay=0.05):
+        self._connect = connect
+        self.enabled = enabled
+        self.delay = delay
+        # Fonctions appelées avec les ids recalculés après chaque lot
+        self.listeners = []
+        self._reset()
+
+    def _reset(self):
+        self._cond = threading.Condition()
+        self._dirty = set()
+        self._enqueued = 0
+        self._completed = 0
+        self._urgent = False
+        self._thread = None
+        self._pid = os.getpid()
+        self.batches = 0
+        self.events = 0
+
+    def _after_fork(self):
+        # Les threads ne survivent pas au fork: un worker prefork repart à zéro
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='aggregation-worker',
+                                            daemon=True)
+            self._thread.start()
+
+    def mark_dirty(self, *category_ids):
+        """Signale des catégories dont le nombre de produits a changé"""
+        if not self.enabled or not category_ids:
+            return
+        self._after_fork()
+        with self._cond:
+            self._dirty.update(category_ids)
+            self._enqueued += 1
+            self.events += 1
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Attend que tous les signalements déjà reçus soient appliqués.
+
+        Renvoie False si le délai expire avant.
+        """
+        if not self.enabled:
+            return True
+        self._after_fork()
+        with self._cond:
+            target = self._enqueued
+            if self._completed >= target:
+                return True
+            self._urgent = True
+            self._ensure_thread()
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._completed >= target, timeout)
+
+    @property
+    def pending(self):
+        with self._cond:
+            return self._enqueued - self._completed
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty)
+                # Fenêtre de regroupement, écourtée par flush()
+                self._cond.wait_for(lambda: self._urgent, self.delay)
+                dirty, self._dirty = self._dirty, set()
+                target = self._enqueued
+                self._urgent = False
+            try:
+                affected = self.recompute(dirty)
+            except Exception:
+                logger.exception('Échec du recalcul des compteurs, nouvel essai')
+                with self._cond:
+                    self._dirty |= dirty
+                    self._cond.wait(self.delay * 10 or 1)
+                continue
+            with self._cond:
+                self._completed = target
+                self.batches += 1
+                self._cond.notify_all()
+            for listener in self.listeners:
+                try:
+                    listener(affected)
+                except Exception:
+                    logger.exception('Échec d\'un abonné du worker d\'agrégation')
+
+    def recompute(self, category_ids):
+        """Recalcule les catégories et leurs ancêtres; renvoie les ids touchés"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            affected = [row[0] for row in conn.execute('''
+                SELECT c.id FROM categories c
+                WHERE c.id IN (
+                    SELECT cc.ancestor FROM category_closure cc
+                    WHERE cc.descendant IN (SELECT value FROM json_each(?))
+                )
+                ORDER BY c.level DESC
+            ''', (json.dumps(sorted(category_ids)),))]
+            conn.executemany('''
+                UPDATE categories
+                SET product_count =
+                    (SELECT COUNT(*) FROM products p WHERE p.category_id = categories.id)
+                    + (SELECT COALESCE(SUM(ch.product_count), 0) FROM categories ch
+                       WHERE ch.parent_id = categories.id)
+                WHERE id = ?
+            ''', [(category_id,) for category_id in affected])
+            if affected:
+                bump_catalog_version(conn)
+            conn.commit()
+            return affected
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def metric_lines(self):
+        """Événements reçus, lots appliqués et file en attente du worker (/metrics)"""
+        return [
+            '# TYPE aggregation_events_total counter',
+            f'aggregation_events_total {self.events}',
+            '# TYPE aggregation_batches_total counter',
+            f'aggregation_batches_total {self.batches}',
+            '# TYPE aggregation_pending_events gauge',
+            f'aggregation_pending_events {self.pending}',
+        ]
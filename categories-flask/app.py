@@ -1,26 +1,115 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
-from database import (init_db, get_db_connection, calculate_category_level, 
-                     update_product_counts, get_category_parentage, 
-                     check_circular_reference, create_sample_data)
-from models import Category, Product
+import json
+from collections import Counter
+import click
+from flask import (Flask, Response, g, render_template, request, redirect, url_for,
+                   jsonify, flash)
+from database import (init_db, init_app, get_read_db, get_write_db,
+                     calculate_category_level, update_product_counts,
+                     get_category_parentage, get_category_subtree,
+                     create_sample_data, adjust_product_counts,
+                     adjust_product_counts_many,
+                     bump_catalog_version, get_catalog_version, get_db_connection,
+                     rebuild_search_index, category_index)
+from bulk_import import import_stream, text_stream, IMPORTERS, BATCH_SIZE
+from pagination import (parse_page_args, keyset_clause, page_envelope, stream_json_array,
+                        DEFAULT_PAGE_SIZE)
+from http_cache import catalog_etag
+from aggregates import AggregationWorker
+from changes import (get_changes, compact_changes, DEFAULT_LIMIT as CHANGES_DEFAULT_LIMIT,
+                     MAX_LIMIT as CHANGES_MAX_LIMIT)
+from facets import get_facets, rebuild_facets
+from migrations import migrate, schema_version, check_query_plans
+from category_tree import fetch_tree_rows, build_tree
+from subtrees import check_move, move_subtree, delete_subtree
+from snapshot import SnapshotStore, export_snapshot, listing_response
+from queries import (CATEGORIES_LISTING, PRODUCTS_LISTING, INDEX_CATEGORIES, CATEGORY_PRODUCTS,
+                     SUBCATEGORIES, AVAILABLE_PARENTS, CATEGORY_PRODUCTS_PAGE,
+                     SUBTREE_PRODUCTS_PAGE, CATEGORY_CHILD_COUNT, CATEGORY_PRODUCT_COUNT)
+from serializers import raw_cursor, rows_response, page_response, stream_rows
+from page_cache import PageCache, category_tags
+from instrumentation import init_instrumentation, metrics
+from compression import init_compression
+from admission import init_admission
+from search import (build_match_query, SEARCHES, DEFAULT_LIMIT as SEARCH_DEFAULT_LIMIT,
+                    MAX_LIMIT as SEARCH_MAX_LIMIT)
 
 app = Flask(__name__)
 app.secret_key = 'votre_cle_secrete_ici'
+# Configuration surchargeable par l'environnement (ex: FLASK_INSTRUMENTATION=true)
+app.config.from_prefixed_env()
+init_app(app)
+init_instrumentation(app)
+# Compression gzip/deflate des réponses JSON et HTML (FLASK_COMPRESSION=false pour couper)
+compressor = init_compression(app)
+if compressor is not None:
+    metrics.collectors.append(compressor.metric_lines)
+# Limites de concurrence par route et délestage en 503 (FLASK_ADMISSION_CONTROL=true)
+admission = init_admission(app)
+if admission is not None:
+    metrics.collectors.append(admission.metric_lines)
+
+# Cache des pages HTML rendues, invalidé par les routes d'écriture
+page_cache = PageCache(max_entries=app.config.get('PAGE_CACHE_SIZE', 1024),
+                       ttl=app.config.get('PAGE_CACHE_TTL', 60))
+metrics.collectors.append(page_cache.metric_lines)
+# Arbres JSON des catégories, indexés par version du catalogue
+tree_cache = PageCache(max_entries=64, ttl=app.config.get('PAGE_CACHE_TTL', 60))
+
+# Compteurs de produits maintenus en arrière-plan si AGGREGATION_WORKER est vrai
+aggregator = AggregationWorker(get_db_connection,
+                               enabled=app.config.get('AGGREGATION_WORKER', False),
+                               delay=app.config.get('AGGREGATION_DELAY', 0.05))
+aggregator.listeners.append(lambda ids: page_cache.invalidate(*category_tags(ids)))
+metrics.collectors.append(aggregator.metric_lines)
+
+# Instantané binaire projeté en mémoire (flask export-snapshot), rechargé à chaud
+snapshots = SnapshotStore(app.config.get('CATALOG_SNAPSHOT'),
+                          check_interval=app.config.get('CATALOG_SNAPSHOT_CHECK_INTERVAL', 1.0))
+
+def current_snapshot():
+    """Instantané à jour pour la requête en cours, sinon None (lecture en base).
+
+    Avec CATALOG_SNAPSHOT_ALLOW_STALE (réplicas en lecture seule), un
+    instantané en retard est servi avec l'ETag de sa propre version.
+    """
+    if '_snapshot' in g:
+        return g._snapshot
+    if 'catalog_version' not in g:
+        # Vue sans catalog_etag (pages HTML)
+        g.catalog_version = get_catalog_version(get_read_db())
+    snapshot = snapshots.acquire()
+    if snapshot is not None and snapshot.version != g.catalog_version:
+        if app.config.get('CATALOG_SNAPSHOT_ALLOW_STALE', False):
+            g.catalog_version = snapshot.version
+        else:
+            snapshots.release(snapshot)
+            snapshot = None
+    g._snapshot = snapshot
+    return snapshot
+
+@app.teardown_request
+def _release_snapshot(exc=None):
+    snapshot = g.pop('_snapshot', None)
+    if snapshot is not None:
+        snapshots.release(snapshot)
+
+def category_exists(conn, category_id):
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        return snapshot.has_category(category_id)
+    row = conn.execute('SELECT 1 FROM categories WHERE id = ?', (category_id,)).fetchone()
+    return row is not None
+
+# Nombre maximal d'objets acceptés par un POST en lot
+MAX_BATCH_SIZE = app.config.get('MAX_BATCH_SIZE', 1000)
 
 @app.route('/')
+@page_cache.cached(lambda: ['index'])
 def index():
-    conn = get_db_connection()
+    conn = get_read_db()
     
     # Récupérer toutes les catégories avec leurs informations calculées
-    categories = conn.execute('''
-        SELECT c.*, 
-               CASE 
-                   WHEN c.parent_id IS NULL THEN c.name
-                   ELSE (SELECT name FROM categories p WHERE p.id = c.parent_id) || ' > ' || c.name
-               END as parentage_simple
-        FROM categories c 
-        ORDER BY c.level, c.name
-    ''').fetchall()
+    categories = conn.execute(INDEX_CATEGORIES).fetchall()
     
     # Enrichir avec la parenté complète
     categories_enriched = []
@@ -29,14 +118,181 @@ def index():
         cat_dict['parentage'] = get_category_parentage(cat['id'])
         categories_enriched.append(cat_dict)
     
-    conn.close()
     return render_template('index.html', categories=categories_enriched)
 
+def _batch_error(errors):
+    return jsonify({'success': False, 'errors': errors}), 400
+
+def _create_categories_batch(items):
+    """Crée un lot de catégories dans une seule transaction.
+
+    Chaque objet peut porter un "ref" et désigner son parent par "parent_ref"
+    (objet précédent du lot) ou "parent_id" (catégorie existante). Le lot est
+    validé en entier avant toute insertion: à la moindre erreur rien n'est créé.
+    """
+    conn = get_write_db()
+    parent_ids = [item.get('parent_id') for item in items
+                  if isinstance(item, dict) and item.get('parent_id')]
+    parent_levels = dict(conn.execute(
+        'SELECT id, level FROM categories WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(parent_ids),)
+    ).fetchall()) if parent_ids else {}
+
+    errors = []
+    levels = []
+    refs = {}
+    for index, item in enumerate(items):
+        level = None
+        if not isinstance(item, dict):
+            error = 'Objet attendu'
+        elif not item.get('name'):
+            error = 'Le nom est requis'
+        elif item.get('parent_ref') is not None:
+            parent_index = refs.get(item['parent_ref'])
+            if parent_index is None:
+                error = 'parent_ref ne désigne aucun objet précédent du lot'
+            elif levels[parent_index] is None:
+                error = 'Catégorie parent invalide dans le lot'
+            else:
+                level = levels[parent_index] + 1
+                error = None
+        elif item.get('parent_id'):
+            try:
+                parent_level = parent_levels.get(int(item['parent_id']))
+            except (TypeError, ValueError):
+                parent_level = None
+            if parent_level is None:
+                error = 'Catégorie parent introuvable'
+            else:
+                level = parent_level + 1
+                error = None
+        else:
+            level = 1
+            error = None
+
+        if error is None and level > 3:
+            error = 'Maximum 3 niveaux de catégories autorisés'
+        ref = item.get('ref') if isinstance(item, dict) else None
+        if error is None and ref is not None and ref in refs:
+            error = f'ref en double: {ref}'
+        if error is not None:
+            errors.append({'index': index, 'error': error})
+            level = None
+        if ref is not None and ref not in refs:
+            refs[ref] = index
+        levels.append(level)
+
+    if errors:
+        return _batch_error(errors)
+
+    ids = []
+    for item, level in zip(items, levels):
+        if item.get('parent_ref') is not None:
+            parent_id = ids[refs[item['parent_ref']]]
+        else:
+            parent_id = int(item['parent_id']) if item.get('parent_id') else None
+        cursor = conn.execute(
+            'INSERT INTO categories (name, description, parent_id, level) VALUES (?, ?, ?, ?)',
+            (item['name'], item.get('description', ''), parent_id, level)
+        )
+        ids.append(cursor.lastrowid)
+    hierarchy_version = bump_catalog_version(conn, categories=True)
+    conn.commit()
+
+    rows = {row['id']: row for row in conn.execute(
+        'SELECT * FROM categories WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(ids),)
+    )}
+    created = [rows[category_id] for category_id in ids]
+    category_index.add_many([(row['id'], row['name'], row['parent_id']) for row in created],
+                            hierarchy_version)
+    page_cache.invalidate(*category_tags({row['parent_id'] for row in created
+                                          if row['parent_id'] is not None}))
+
+    return jsonify({
+        'success': True,
+        'categories': [{'index': index, 'ref': item.get('ref'), 'category': dict(row)}
+                       for index, (item, row) in enumerate(zip(items, created))],
+    }), 201
+
+def _create_products_batch(items):
+    """Crée un lot de produits: une transaction, une mise à jour des compteurs"""
+    conn = get_write_db()
+    category_ids = [item.get('category_id') for item in items
+                    if isinstance(item, dict) and item.get('category_id')]
+    existing = {row[0] for row in conn.execute(
+        'SELECT id FROM categories WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(category_ids),)
+    )} if category_ids else set()
+
+    errors = []
+    values = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'error': 'Objet attendu'})
+            continue
+        if not item.get('name') or not item.get('price') or not item.get('category_id'):
+            errors.append({'index': index, 'error': 'Nom, prix et catégorie sont requis'})
+            continue
+        try:
+            price = float(item['price'])
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'error': 'Prix invalide'})
+            continue
+        try:
+            category_id = int(item['category_id'])
+        except (TypeError, ValueError):
+            category_id = None
+        if category_id not in existing:
+            errors.append({'index': index, 'error': 'Catégorie introuvable'})
+            continue
+        values.append((item['name'], item.get('description', ''), price, category_id))
+
+    if errors:
+        return _batch_error(errors)
+
+    ids = [conn.execute(
+        'INSERT INTO products (name, description, price, category_id) VALUES (?, ?, ?, ?)',
+        row
+    ).lastrowid for row in values]
+    deltas = Counter(row[3] for row in values)
+    if not aggregator.enabled:
+        adjust_product_counts_many(conn, deltas)
+    bump_catalog_version(conn)
+    conn.commit()
+    aggregator.mark_dirty(*deltas)
+
+    page_cache.invalidate(*category_tags({ancestor for category_id in deltas
+                                          for ancestor in category_index.ancestors(category_id)}))
+    rows = {row['id']: row for row in conn.execute(
+        'SELECT * FROM products WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(ids),)
+    )}
+
+    return jsonify({
+        'success': True,
+        'products': [{'index': index, 'product': dict(rows[product_id])}
+                     for index, product_id in enumerate(ids)],
+    }), 201
+
+def _check_batch_size(data):
+    """Vérifie la taille d'un lot; renvoie une réponse d'erreur ou None"""
+    if not data:
+        return jsonify({'error': 'Lot vide'}), 400
+    if len(data) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Lot limité à {MAX_BATCH_SIZE} objets'}), 400
+    return None
+
 @app.route('/api/category', methods=['POST'])
 def create_category():
-    """API unique pour créer catégorie, sous-catégorie ou sous-sous-catégorie"""
+    """API unique pour créer catégorie, sous-catégorie ou sous-sous-catégorie
+
+    Accepte aussi un tableau d'objets, créés dans une seule transaction.
+    """
     try:
         data = request.get_json()
+        if isinstance(data, list):
+            return _check_batch_size(data) or _create_categories_batch(data)
         name = data.get('name')
         description = data.get('description', '')
         parent_id = data.get('parent_id')
@@ -44,14 +300,13 @@ def create_category():
         if not name:
             return jsonify({'error': 'Le nom est requis'}), 400
         
-        conn = get_db_connection()
+        conn = get_write_db()
         
         # Vérifier les références circulaires si parent_id est fourni
         if parent_id:
             # Vérifier que le parent existe
             parent = conn.execute('SELECT id FROM categories WHERE id = ?', (parent_id,)).fetchone()
             if not parent:
-                conn.close()
                 return jsonify({'error': 'Catégorie parent introuvable'}), 400
             
             # Calculer le niveau
@@ -59,7 +314,6 @@ def create_category():
             
             # Vérifier le niveau maximum (3 niveaux max)
             if level > 3:
-                conn.close()
                 return jsonify({'error': 'Maximum 3 niveaux de catégories autorisés'}), 400
         else:
             level = 1
@@ -71,14 +325,14 @@ def create_category():
         )
         
         category_id = cursor.lastrowid
+        hierarchy_version = bump_catalog_version(conn, categories=True)
         conn.commit()
         
         # Récupérer la catégorie créée
         category = conn.execute('SELECT * FROM categories WHERE id = ?', (category_id,)).fetchone()
-        conn.close()
-        
-        # Mettre à jour les compteurs
-        update_product_counts()
+        category_index.add(category_id, category['name'], category['parent_id'], hierarchy_version)
+        # Seules la page d'accueil et la page du parent listent la nouvelle catégorie
+        page_cache.invalidate(*category_tags([category['parent_id']] if category['parent_id'] else []))
         
         return jsonify({
             'success': True,
@@ -91,9 +345,11 @@ def create_category():
 
 @app.route('/api/product', methods=['POST'])
 def create_product():
-    """API unique pour créer un produit"""
+    """API unique pour créer un produit (ou un tableau de produits)"""
     try:
         data = request.get_json()
+        if isinstance(data, list):
+            return _check_batch_size(data) or _create_products_batch(data)
         name = data.get('name')
         description = data.get('description', '')
         price = data.get('price')
@@ -107,12 +363,11 @@ def create_product():
         except ValueError:
             return jsonify({'error': 'Prix invalide'}), 400
         
-        conn = get_db_connection()
+        conn = get_write_db()
         
         # Vérifier que la catégorie existe
         category = conn.execute('SELECT id FROM categories WHERE id = ?', (category_id,)).fetchone()
         if not category:
-            conn.close()
             return jsonify({'error': 'Catégorie introuvable'}), 400
         
         # Insérer le nouveau produit
@@ -122,14 +377,18 @@ def create_product():
         )
         
         product_id = cursor.lastrowid
+        
+        # Mettre à jour les compteurs de la catégorie et de ses ancêtres
+        if not aggregator.enabled:
+            adjust_product_counts(conn, category_id, 1)
+        bump_catalog_version(conn)
         conn.commit()
+        aggregator.mark_dirty(category['id'])
+        # Les compteurs affichés changent sur toute la chaîne des ancêtres
+        page_cache.invalidate(*category_tags(category_index.ancestors(category_id)))
         
         # Récupérer le produit créé
         product = conn.execute('SELECT * FROM products WHERE id = ?', (product_id,)).fetchone()
-        conn.close()
-        
-        # Mettre à jour les compteurs de produits
-        update_product_counts()
         
         return jsonify({
             'success': True,
@@ -140,80 +399,246 @@ def create_product():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/categories')
+@catalog_etag
 def get_categories():
-    """Récupérer toutes les catégories avec leurs informations"""
-    conn = get_db_connection()
-    categories = conn.execute('SELECT * FROM categories ORDER BY level, name').fetchall()
-    conn.close()
+    """Récupérer toutes les catégories avec leurs informations
+
+    Pagination par clé (level, name, id) avec ?limit=&cursor=, ou flux JSON
+    avec ?stream=1.
+    """
+    try:
+        page = parse_page_args(request.args, 3)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    categories_list = []
-    for cat in categories:
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        try:
+            return listing_response(snapshot.categories, page)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    where, params = keyset_clause(('level', 'name', 'id'), page.after)
+    query = CATEGORIES_LISTING.format(where=where)
+    conn = get_read_db()
+    
+    def serialize(cat):
         cat_dict = dict(cat)
         cat_dict['parentage'] = get_category_parentage(cat['id'])
-        categories_list.append(cat_dict)
+        return cat_dict
     
-    return jsonify(categories_list)
+    if page.stream:
+        return stream_json_array(conn.execute(query, params), serialize)
+    if page.paginated:
+        categories = conn.execute(query + ' LIMIT ?', params + (page.limit + 1,)).fetchall()
+        return jsonify(page_envelope(categories, page.limit,
+                                     lambda c: (c['level'], c['name'], c['id']), serialize))
+    
+    categories = conn.execute(query, params).fetchall()
+    return jsonify([serialize(cat) for cat in categories])
+
+@app.route('/api/categories/tree')
+@app.route('/api/categories/tree/<int:root_id>')
+@catalog_etag
+def get_category_tree(root_id=None):
+    """Hiérarchie imbriquée (children), entière ou limitée au sous-arbre de root_id
+
+    ?depth=N limite le nombre de niveaux renvoyés. Le JSON est mémorisé par
+    version du catalogue: toute écriture le rend obsolète.
+    """
+    depth = request.args.get('depth')
+    if depth is not None:
+        try:
+            depth = int(depth)
+        except ValueError:
+            depth = 0
+        if depth < 1:
+            return jsonify({'error': 'Paramètre depth invalide'}), 400
+
+    key = (g.catalog_version, root_id, depth)
+    body = tree_cache.get(key)
+    if body is None:
+        roots = build_tree(fetch_tree_rows(get_read_db(), root_id, depth))
+        if root_id is not None and not roots:
+            return jsonify({'error': 'Catégorie introuvable'}), 404
+        body = app.json.dumps(roots[0] if root_id is not None else roots)
+        tree_cache.set(key, body)
+    return Response(body, mimetype='application/json')
 
 @app.route('/api/categories/parents/<int:category_id>')
+@catalog_etag
 def get_available_parents(category_id):
     """Récupérer les parents disponibles pour éviter les boucles infinies"""
-    conn = get_db_connection()
-    
-    # Récupérer toutes les catégories sauf la catégorie elle-même et ses descendants
-    all_categories = conn.execute('SELECT * FROM categories WHERE id != ?', (category_id,)).fetchall()
+    # La catégorie et ses descendants sont exclus en un seul parcours du sous-arbre
+    excluded = get_category_subtree(category_id)
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        candidates = snapshot.categories_by_id(max_level=3)
+    else:
+        candidates = get_read_db().execute(AVAILABLE_PARENTS).fetchall()
     
     available_parents = []
-    for cat in all_categories:
-        # Vérifier qu'il n'y a pas de référence circulaire
-        if not check_circular_reference(category_id, cat['id']):
-            # Vérifier que le niveau ne dépasse pas 3
-            if cat['level'] < 3:
-                available_parents.append(dict(cat))
-    
-    conn.close()
+    for cat in candidates:
+        if cat['id'] not in excluded and cat['id'] != category_id:
+            cat = dict(cat)
+            cat.pop('parentage', None)
+            available_parents.append(cat)
     return jsonify(available_parents)
 
 @app.route('/api/products')
+@catalog_etag
 def get_products():
-    """Récupérer tous les produits avec leurs catégories"""
-    conn = get_db_connection()
-    products = conn.execute('''
-        SELECT p.*, c.name as category_name
-        FROM products p
-        JOIN categories c ON p.category_id = c.id
-        ORDER BY p.name
-    ''').fetchall()
-    conn.close()
+    """Récupérer tous les produits avec leurs catégories
+
+    Pagination par clé (name, id) avec ?limit=&cursor=, ou flux JSON avec
+    ?stream=1.
+    """
+    try:
+        page = parse_page_args(request.args, 2)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        try:
+            return listing_response(snapshot.products, page)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    where, params = keyset_clause(('p.name', 'p.id'), page.after)
+    query = PRODUCTS_LISTING.format(where=where)
+    conn = get_read_db()
+    
+    # Route la plus sollicitée: tuples bruts sérialisés directement en JSON
+    if page.stream:
+        return stream_rows(raw_cursor(conn, query, params))
+    if page.paginated:
+        cursor = raw_cursor(conn, query + ' LIMIT ?', params + (page.limit + 1,))
+        return page_response(cursor, page.limit, ('name', 'id'))
+    
+    return rows_response(raw_cursor(conn, query, params))
+
+@app.route('/api/category/<int:category_id>/facets')
+@catalog_etag
+def get_category_facets(category_id):
+    """Prix min/max/moyen et histogramme par tranches du sous-arbre d'une catégorie"""
+    conn = get_read_db()
+    if not category_exists(conn, category_id):
+        return jsonify({'error': 'Catégorie introuvable'}), 404
+    return jsonify(get_facets(conn, category_id))
+
+# Tris disponibles pour les produits d'une catégorie: colonnes de clé, ordre décroissant
+PRODUCT_SORTS = {
+    'name': (('p.name', 'p.id'), False),
+    'price': (('p.price', 'p.id'), False),
+    '-price': (('p.price', 'p.id'), True),
+}
+
+@app.route('/api/category/<int:category_id>/products')
+@catalog_etag
+def get_category_products(category_id):
+    """Produits d'une catégorie, ou de tout son sous-arbre avec ?recursive=1
+
+    Le sous-arbre passe par une seule jointure indexée sur la table de
+    fermeture, quelle que soit la profondeur; une catégorie seule suit
+    directement l'index (category_id, tri). Pagination par clé
+    (?limit=&cursor=) et tri ?sort=name|price|-price.
+    """
+    sort = request.args.get('sort', 'name')
+    if sort not in PRODUCT_SORTS:
+        return jsonify({'error': 'Tri inconnu (name, price ou -price)'}), 400
+    columns, descending = PRODUCT_SORTS[sort]
+    recursive = request.args.get('recursive', '').lower() in ('1', 'true', 'yes')
+    
+    try:
+        page = parse_page_args(request.args, len(columns))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = page.limit or DEFAULT_PAGE_SIZE
+    
+    conn = get_read_db()
+    if not category_exists(conn, category_id):
+        return jsonify({'error': 'Catégorie introuvable'}), 404
+    
+    keyset, params = keyset_clause(columns, page.after, descending, keyword='AND')
+    direction = ' DESC' if descending else ''
+    query = SUBTREE_PRODUCTS_PAGE if recursive else CATEGORY_PRODUCTS_PAGE
+    order = ', '.join(column + direction for column in columns)
+    products = conn.execute(query.format(keyset=keyset, order=order), (category_id,) + params + (limit + 1,)).fetchall()
     
-    return jsonify([dict(product) for product in products])
+    key_names = [column.split('.')[1] for column in columns]
+    return jsonify(page_envelope(products, limit, lambda p: [p[name] for name in key_names]))
+
+@app.route('/api/changes')
+@catalog_etag
+def get_catalog_changes():
+    """Modifications (upserts et tombstones) postérieures à ?since=<seq>
+
+    Pagination par ?limit=; has_more indique qu'il faut rappeler avec
+    next_since. resync=true: l'historique a été compacté, le client doit
+    recharger /api/categories et /api/products puis reprendre à next_since.
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', CHANGES_DEFAULT_LIMIT, type=int)
+    if since < 0 or limit < 1:
+        return jsonify({'error': 'Paramètres since ou limit invalides'}), 400
+    limit = min(limit, CHANGES_MAX_LIMIT)
+    return jsonify(get_changes(get_read_db(), since, limit, get_category_parentage))
+
+@app.route('/api/search')
+@catalog_etag
+def search():
+    """Recherche plein texte (FTS5, classement BM25) dans les produits et catégories"""
+    match = build_match_query(request.args.get('q'))
+    if match is None:
+        return jsonify({'error': 'Le paramètre q est requis'}), 400
+    
+    kind = request.args.get('type', 'all')
+    if kind != 'all' and kind not in SEARCHES:
+        return jsonify({'error': 'Type de recherche inconnu'}), 400
+    
+    try:
+        limit = min(int(request.args.get('limit', SEARCH_DEFAULT_LIMIT)), SEARCH_MAX_LIMIT)
+        offset = int(request.args.get('offset', 0))
+        category_id = request.args.get('category_id', type=int)
+    except ValueError:
+        return jsonify({'error': 'Paramètres de pagination invalides'}), 400
+    if limit < 1 or offset < 0:
+        return jsonify({'error': 'Paramètres de pagination invalides'}), 400
+    
+    conn = get_read_db()
+    results = {'query': request.args.get('q'), 'limit': limit, 'offset': offset}
+    for name, run_search in SEARCHES.items():
+        if kind in ('all', name):
+            results[name] = run_search(conn, match, category_id, limit, offset)
+    
+    return jsonify(results)
 
 @app.route('/category/<int:category_id>')
+@page_cache.cached(lambda category_id: [f'category:{category_id}'])
 def view_category(category_id):
     """Afficher une catégorie spécifique avec ses produits"""
-    conn = get_db_connection()
+    conn = get_read_db()
     
-    category = conn.execute('SELECT * FROM categories WHERE id = ?', (category_id,)).fetchone()
-    if not category:
-        conn.close()
+    # Catégorie et parenté lues dans l'instantané s'il est à jour
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        category_dict = snapshot.category(category_id)
+    else:
+        category = conn.execute('SELECT * FROM categories WHERE id = ?', (category_id,)).fetchone()
+        category_dict = dict(category) if category else None
+    if not category_dict:
         flash('Catégorie introuvable')
         return redirect(url_for('index'))
     
     # Récupérer les produits de cette catégorie
-    products = conn.execute(
-        'SELECT * FROM products WHERE category_id = ? ORDER BY name',
-        (category_id,)
-    ).fetchall()
+    products = conn.execute(CATEGORY_PRODUCTS, (category_id,)).fetchall()
     
     # Récupérer les sous-catégories
-    subcategories = conn.execute(
-        'SELECT * FROM categories WHERE parent_id = ? ORDER BY name',
-        (category_id,)
-    ).fetchall()
-    
-    conn.close()
+    subcategories = conn.execute(SUBCATEGORIES, (category_id,)).fetchall()
     
-    category_dict = dict(category)
-    category_dict['parentage'] = get_category_parentage(category_id)
+    if 'parentage' not in category_dict:
+        category_dict['parentage'] = get_category_parentage(category_id)
     
     return render_template('category.html', 
                          category=category_dict,
@@ -223,43 +648,189 @@ def view_category(category_id):
 @app.route('/delete/category/<int:id>')
 def delete_category(id):
     """Supprimer une catégorie"""
-    conn = get_db_connection()
+    conn = get_write_db()
     
     # Vérifier s'il y a des sous-catégories
-    subcategories = conn.execute('SELECT COUNT(*) FROM categories WHERE parent_id = ?', (id,)).fetchone()[0]
+    subcategories = conn.execute(CATEGORY_CHILD_COUNT, (id,)).fetchone()[0]
     if subcategories > 0:
-        conn.close()
         flash('Impossible de supprimer: cette catégorie a des sous-catégories')
         return redirect(url_for('index'))
     
     # Vérifier s'il y a des produits
-    products = conn.execute('SELECT COUNT(*) FROM products WHERE category_id = ?', (id,)).fetchone()[0]
+    products = conn.execute(CATEGORY_PRODUCT_COUNT, (id,)).fetchone()[0]
     if products > 0:
-        conn.close()
         flash('Impossible de supprimer: cette catégorie a des produits')
         return redirect(url_for('index'))
     
     # Supprimer la catégorie
     conn.execute('DELETE FROM categories WHERE id = ?', (id,))
+    hierarchy_version = bump_catalog_version(conn, categories=True)
     conn.commit()
-    conn.close()
+    # La catégorie supprimée et son parent direct (liste des sous-catégories)
+    page_cache.invalidate(*category_tags(category_index.ancestors(id)[:2]))
+    category_index.remove(id, hierarchy_version)
     
-    update_product_counts()
     flash('Catégorie supprimée avec succès')
     return redirect(url_for('index'))
 
 @app.route('/delete/product/<int:id>')
 def delete_product(id):
     """Supprimer un produit"""
-    conn = get_db_connection()
-    conn.execute('DELETE FROM products WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
+    conn = get_write_db()
+    product = conn.execute('SELECT category_id FROM products WHERE id = ?', (id,)).fetchone()
+    if product:
+        conn.execute('DELETE FROM products WHERE id = ?', (id,))
+        if not aggregator.enabled:
+            adjust_product_counts(conn, product['category_id'], -1)
+        bump_catalog_version(conn)
+        conn.commit()
+        aggregator.mark_dirty(product['category_id'])
+        page_cache.invalidate(*category_tags(category_index.ancestors(product['category_id'])))
     
-    update_product_counts()
     flash('Produit supprimé avec succès')
     return redirect(url_for('index'))
 
+@app.route('/api/category/<int:category_id>/move', methods=['POST'])
+def move_category(category_id):
+    """Déplace une catégorie et tout son sous-arbre sous un autre parent
+
+    Corps JSON: {"parent_id": <id>} ou {"parent_id": null} pour une racine.
+    Seuls le sous-arbre et les chaînes d'ancêtres, ancienne et nouvelle,
+    sont mis à jour.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'parent_id' not in data:
+        return jsonify({'error': 'parent_id requis (null pour une racine)'}), 400
+    parent_id = data['parent_id']
+    if parent_id is not None:
+        try:
+            parent_id = int(parent_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'parent_id invalide'}), 400
+
+    conn = get_write_db()
+    # Validation et déplacement sous le même verrou d'écriture
+    conn.execute('BEGIN IMMEDIATE')
+    category = conn.execute('SELECT parent_id, product_count FROM categories WHERE id = ?',
+                            (category_id,)).fetchone()
+    if category is None:
+        conn.rollback()
+        return jsonify({'error': 'Catégorie introuvable'}), 404
+    old_parent_id = category['parent_id']
+
+    moved = []
+    if parent_id == old_parent_id:
+        conn.rollback()
+    else:
+        error = check_move(conn, category_id, parent_id)
+        if error:
+            conn.rollback()
+            return jsonify({'error': error}), 400
+        if not aggregator.enabled:
+            deltas = Counter()
+            if old_parent_id is not None:
+                deltas[old_parent_id] -= category['product_count']
+            if parent_id is not None:
+                deltas[parent_id] += category['product_count']
+            adjust_product_counts_many(conn, deltas)
+        moved = move_subtree(conn, category_id, parent_id)
+        hierarchy_version = bump_catalog_version(conn, categories=True)
+        conn.commit()
+
+        parents = [p for p in (old_parent_id, parent_id) if p is not None]
+        aggregator.mark_dirty(*parents)
+        # Pages du sous-arbre (parenté affichée) et des deux chaînes d'ancêtres
+        stale = set(moved)
+        for p in parents:
+            stale.update(category_index.ancestors(p))
+        category_index.move(category_id, parent_id, hierarchy_version)
+        page_cache.invalidate(*category_tags(stale))
+
+    row = conn.execute('SELECT * FROM categories WHERE id = ?', (category_id,)).fetchone()
+    return jsonify({
+        'success': True,
+        'category': dict(row),
+        'parentage': get_category_parentage(category_id),
+        'moved': len(moved),
+    })
+
+@app.route('/api/category/<int:category_id>', methods=['DELETE'])
+def delete_category_tree(category_id):
+    """Supprime une catégorie; avec ?cascade=1, aussi ses descendants et leurs produits"""
+    cascade = request.args.get('cascade', '').lower() in ('1', 'true', 'yes')
+    conn = get_write_db()
+    conn.execute('BEGIN IMMEDIATE')
+    category = conn.execute('SELECT parent_id FROM categories WHERE id = ?',
+                            (category_id,)).fetchone()
+    if category is None:
+        conn.rollback()
+        return jsonify({'error': 'Catégorie introuvable'}), 404
+    parent_id = category['parent_id']
+
+    if not cascade:
+        not_empty = conn.execute('''
+            SELECT EXISTS (SELECT 1 FROM categories WHERE parent_id = ?)
+                OR EXISTS (SELECT 1 FROM products WHERE category_id = ?)
+        ''', (category_id, category_id)).fetchone()[0]
+        if not_empty:
+            conn.rollback()
+            return jsonify({'error': 'La catégorie a des sous-catégories ou des produits '
+                                     '(?cascade=1 pour tout supprimer)'}), 409
+
+    ancestors = category_index.ancestors(category_id)
+    deleted, products = delete_subtree(conn, category_id)
+    if products and parent_id is not None and not aggregator.enabled:
+        adjust_product_counts_many(conn, {parent_id: -products})
+    hierarchy_version = bump_catalog_version(conn, categories=True)
+    conn.commit()
+
+    if parent_id is not None:
+        aggregator.mark_dirty(parent_id)
+    category_index.remove_subtree(category_id, hierarchy_version)
+    page_cache.invalidate(*category_tags(set(deleted) | set(ancestors)))
+
+    return jsonify({
+        'success': True,
+        'deleted_categories': deleted,
+        'deleted_products': products,
+    })
+
+@app.route('/api/import/<kind>', methods=['POST'])
+def bulk_import(kind):
+    """Import en masse de catégories ou de produits (NDJSON ou CSV en flux)"""
+    if kind not in IMPORTERS:
+        return jsonify({'error': 'Type d\'import inconnu'}), 404
+    
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Format inconnu (csv ou ndjson)'}), 400
+    
+    try:
+        report = import_stream(get_write_db(), kind, text_stream(request.stream), fmt)
+    except Exception as e:
+        page_cache.clear()
+        return jsonify({'error': str(e)}), 500
+    
+    if report.inserted:
+        page_cache.clear()
+    
+    return jsonify(report.to_dict()), 200
+
+@app.route('/api/aggregates/flush', methods=['POST'])
+def flush_aggregates():
+    """Attend l'application des compteurs en attente (lecture de ses écritures)"""
+    timeout = request.args.get('timeout', 10, type=float)
+    if not aggregator.flush(timeout):
+        return jsonify({'success': False, 'pending': aggregator.pending}), 504
+    return jsonify({'success': True, 'pending': 0})
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Compteurs du cache des pages rendues"""
+    return jsonify(page_cache.stats())
+
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
     """Page d'inscription"""
@@ -290,6 +861,107 @@ def login():
     flash('Page de connexion - À implémenter')
     return redirect(url_for('signup'))
 
+@app.cli.command('rebuild-counts')
+def rebuild_counts_command():
+    """Reconstruit tous les compteurs de produits (réparation)"""
+    update_product_counts()
+    print('Compteurs de produits reconstruits')
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Reconstruit les index de recherche plein texte"""
+    rebuild_search_index()
+    print('Index de recherche reconstruits')
+
+@app.cli.command('rebuild-facets')
+@click.option('--buckets', help='Bornes des tranches de prix, ex: 10,50,100')
+def rebuild_facets_command(buckets):
+    """Reconstruit les facettes de prix (et change les tranches avec --buckets)"""
+    bounds = [float(bound) for bound in buckets.split(',')] if buckets else None
+    conn = get_db_connection()
+    try:
+        rebuild_facets(conn, bounds)
+        bump_catalog_version(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    print('Facettes de prix reconstruites')
+
+@app.cli.command('export-snapshot')
+@click.argument('path', default='catalog.snap')
+def export_snapshot_command(path):
+    """Écrit l'instantané binaire du catalogue (servi si CATALOG_SNAPSHOT=path)"""
+    conn = get_db_connection()
+    try:
+        header = export_snapshot(conn, path)
+    finally:
+        conn.close()
+    print(f"Instantané {path}: version {header['catalog_version']}, "
+          f"{header['categories']} catégorie(s), {header['products']} produit(s)")
+
+@app.cli.command('compact-changes')
+@click.option('--keep', type=int, help='Nombre d\'entrées conservées (mémorisé)')
+def compact_changes_command(keep):
+    """Compacte le journal des modifications"""
+    conn = get_db_connection()
+    try:
+        compact_changes(conn, keep)
+        # L'horizon a avancé: les ETag de /api/changes ne doivent plus valider,
+        # sinon un client en retard recevrait 304 au lieu de resync
+        bump_catalog_version(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    print('Journal des modifications compacté')
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Applique les migrations de schéma en attente"""
+    conn = get_db_connection()
+    try:
+        applied = migrate(conn)
+        version = schema_version(conn)
+    finally:
+        conn.close()
+    print(f"Migration(s) appliquée(s): {applied or 'aucune'}; schéma en version {version}")
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Vérifie que les requêtes chaudes utilisent un index (code 1 sinon)"""
+    conn = get_db_connection()
+    try:
+        results = check_query_plans(conn)
+    finally:
+        conn.close()
+    failures = 0
+    for name, plan, problems in results:
+        print(f"{'ÉCHEC' if problems else 'ok'}  {name}")
+        for detail in plan:
+            print(f"      {'!! ' if detail in problems else ''}{detail}")
+        failures += bool(problems)
+    if failures:
+        raise SystemExit(1)
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('file', type=click.File('rb'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Format du fichier (déduit de l\'extension par défaut)')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True)
+def import_command(kind, file, fmt, batch_size):
+    """Importe un fichier NDJSON ou CSV de catégories ou de produits"""
+    if fmt is None:
+        fmt = 'csv' if file.name.endswith('.csv') else 'ndjson'
+    conn = get_db_connection()
+    try:
+        report = import_stream(conn, kind, text_stream(file), fmt, batch_size)
+    finally:
+        conn.close()
+    print(f"{report.inserted} ligne(s) importée(s), {report.rejected} rejetée(s)")
+    for error in report.errors:
+        print(f"  ligne {error['line']}: {error['error']}")
+
+# Serveur de développement; en production: python serve.py --workers N
 if __name__ == '__main__':
     init_db()
     create_sample_data()
@@ -0,0 +1,544 @@
+"""Banc d'essai de charge et de latence de l'application Flask.
+
+Sous-commandes:
+
+    python benchmark.py generate bench.db --categories 10000 --depth 3 --products 1000000
+    python benchmark.py run bench.db --mode client --output run.json
+    python benchmark.py run bench.db --mode server --concurrency 8 --output run.json
+    python benchmark.py compare baseline.json run.json --tolerance 0.15
+    python benchmark.py serialize bench.db --rows 100000
+
+Le rapport JSON donne, par route, les latences p50/p95/p99, le débit et le
+nombre de requêtes SQL par requête HTTP; compare signale les régressions par
+rapport à une exécution de référence (code de sortie 1). run travaille sur une
+copie de la base: les scénarios d'écriture ne la modifient pas. serialize
+mesure, par ligne, le temps et la mémoire de la sérialisation JSON de
+/api/products.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import database
+from queries import PRODUCTS_LISTING
+
+WORDS = ['rouge', 'bleu', 'léger', 'classique', 'pro', 'mini', 'ultra', 'été',
+         'hiver', 'coton', 'métal', 'bois', 'sport', 'maison', 'écran', 'sans-fil']
+NOUNS = ['chemise', 'robe', 'téléphone', 'ordinateur', 'lampe', 'chaise', 'table',
+         'casque', 'montre', 'sac', 'veste', 'tapis', 'bouilloire', 'vélo']
+
+
+# --- Génération du catalogue synthétique ---------------------------------------
+
+def generate_catalog(path, categories=10000, depth=3, products=1000000,
+                     fanout=10, seed=42, batch_size=10000):
+    """Crée une base de catalogue synthétique de forme configurable.
+
+    Les catégories sont réparties sur `depth` niveaux avec `fanout` enfants
+    par parent (les racines absorbent le reste); les produits sont attribués
+    au hasard. Niveaux et compteurs sont calculés en Python pendant la
+    génération, sans passer par update_product_counts().
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    database.DATABASE = path
+    database.init_db()
+    rng = random.Random(seed)
+
+    # Nombre de catégories par niveau: racines * fanout^(niveau - 1)
+    weights = [fanout ** level for level in range(depth)]
+    roots = max(1, categories // sum(weights))
+    per_level = [roots * w for w in weights]
+    per_level[0] += categories - sum(per_level)
+
+    conn = database.get_db_connection()
+    parents = {}
+    levels = []
+    next_id = 1
+    previous = []
+    rows = []
+    for level, count in enumerate(per_level, start=1):
+        current = []
+        for i in range(count):
+            parent_id = previous[i % len(previous)] if previous else None
+            parents[next_id] = parent_id
+            rows.append((next_id, f'Catégorie {next_id}', f'{rng.choice(WORDS)} {rng.choice(NOUNS)}',
+                         parent_id, level))
+            current.append(next_id)
+            next_id += 1
+        levels.append(current)
+        previous = current
+    conn.executemany(
+        'INSERT INTO categories (id, name, description, parent_id, level) VALUES (?, ?, ?, ?, ?)',
+        rows
+    )
+    conn.commit()
+
+    all_ids = list(parents)
+    counts = dict.fromkeys(all_ids, 0)
+    batch = []
+    for i in range(1, products + 1):
+        category_id = rng.choice(all_ids)
+        counts[category_id] += 1
+        batch.append((f'{rng.choice(NOUNS)} {rng.choice(WORDS)} {i}',
+                      f'{rng.choice(WORDS)} {rng.choice(WORDS)}',
+                      round(rng.uniform(1, 2000), 2), category_id))
+        if len(batch) >= batch_size:
+            conn.executemany(
+                'INSERT INTO products (name, description, price, category_id) VALUES (?, ?, ?, ?)',
+                batch
+            )
+            conn.commit()
+            batch.clear()
+    if batch:
+        conn.executemany(
+            'INSERT INTO products (name, description, price, category_id) VALUES (?, ?, ?, ?)',
+            batch
+        )
+
+    # Compteurs cumulés: des feuilles vers les racines
+    totals = dict(counts)
+    for level_ids in reversed(levels):
+        for category_id in level_ids:
+            parent_id = parents[category_id]
+            if parent_id is not None:
+                totals[parent_id] += totals[category_id]
+    conn.executemany('UPDATE categories SET product_count = ? WHERE id = ?',
+                     [(total, category_id) for category_id, total in totals.items()])
+    database.bump_catalog_version(conn)
+    conn.commit()
+    conn.close()
+    return {'categories': len(all_ids), 'depth': depth, 'products': products,
+            'per_level': per_level, 'seed': seed}
+
+
+# --- Scénarios ------------------------------------------------------------------
+
+def prepare_delete_targets(conn, count, parent_ids, rng):
+    """Crée les cibles des scénarios de suppression, une par itération.
+
+    Retourne (catégories vides, sous-arbres): chaque sous-arbre est une
+    catégorie avec un enfant et un produit à chacun des deux niveaux, supprimé
+    en cascade. Les triggers tiennent à jour fermeture, recherche et journal.
+    """
+    parents = {row['id']: row['level'] for row in conn.execute(
+        'SELECT id, level FROM categories WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(parent_ids),))}
+
+    def insert_category(name, parent_id):
+        level = parents[parent_id] + 1 if parent_id is not None else 1
+        cursor = conn.execute(
+            'INSERT INTO categories (name, description, parent_id, level) VALUES (?, ?, ?, ?)',
+            (name, '', parent_id, level))
+        parents[cursor.lastrowid] = level
+        return cursor.lastrowid
+
+    def insert_product(category_id):
+        conn.execute('INSERT INTO products (name, description, price, category_id) '
+                     "VALUES ('Bench', '', 9.99, ?)", (category_id,))
+        database.adjust_product_counts(conn, category_id, 1)
+
+    empty, trees = [], []
+    for i in range(count):
+        empty.append(insert_category(f'Bench vide {i}', rng.choice(parent_ids)))
+        root = insert_category(f'Bench arbre {i}', None)
+        child = insert_category(f'Bench feuille {i}', root)
+        insert_product(root)
+        insert_product(child)
+        trees.append(root)
+    database.bump_catalog_version(conn, categories=True)
+    conn.commit()
+    return empty, trees
+
+
+def build_scenarios(conn, rng, iterations):
+    """Routes à mesurer: (nom, fonction produisant (méthode, url, json))
+
+    Lectures d'abord, puis écritures; chaque itération d'une suppression
+    consomme sa propre cible pour ne jamais mesurer un 404 ou un refus.
+    """
+    category_ids = [row['id'] for row in conn.execute('SELECT id FROM categories')]
+    parent_ids = [row['id'] for row in conn.execute('SELECT id FROM categories WHERE level < 3')]
+    root_ids = [row['id'] for row in conn.execute('SELECT id FROM categories WHERE level = 1')]
+    leaf_ids = [row['id'] for row in conn.execute('SELECT id FROM categories WHERE level = 3')] \
+        or category_ids
+    product_ids = [row['id'] for row in conn.execute('SELECT id FROM products')]
+    rng.shuffle(product_ids)
+    # Suite du journal des modifications proche de sa fin, sans resynchronisation
+    last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+    empty_ids, tree_ids = prepare_delete_targets(conn, iterations, parent_ids, rng)
+
+    def get(url):
+        return lambda: ('GET', url() if callable(url) else url, None)
+
+    return [
+        ('index', get('/')),
+        ('categories', get('/api/categories')),
+        ('categories_page', get('/api/categories?limit=100')),
+        ('products', get('/api/products')),
+        ('products_page', get('/api/products?limit=100')),
+        ('tree', get('/api/categories/tree')),
+        ('subtree', get(lambda: f'/api/categories/tree/{rng.choice(root_ids)}')),
+        ('available_parents', get(lambda: f'/api/categories/parents/{rng.choice(category_ids)}')),
+        ('view_category', get(lambda: f'/category/{rng.choice(category_ids)}')),
+        ('category_products', get(lambda: f'/api/category/{rng.choice(root_ids)}/products'
+                                          '?recursive=1&limit=50')),
+        ('facets', get(lambda: f'/api/category/{rng.choice(category_ids)}/facets')),
+        ('changes', get(f'/api/changes?since={max(last_seq - 100, 0)}')),
+        ('search', get(lambda: f'/api/search?q={quote(rng.choice(NOUNS))}')),
+        ('create_category', lambda: ('POST', '/api/category',
+                                     {'name': f'Bench {rng.random()}', 'parent_id': rng.choice(parent_ids)})),
+        ('create_product', lambda: ('POST', '/api/product',
+                                    {'name': f'Bench {rng.random()}', 'price': 9.99,
+                                     'category_id': rng.choice(leaf_ids)})),
+        ('delete_product', get(lambda: f'/delete/product/{product_ids.pop()}')),
+        ('delete_category', get(lambda: f'/delete/category/{empty_ids.pop()}')),
+        ('delete_category_tree', lambda: ('DELETE', f'/api/category/{tree_ids.pop()}?cascade=1',
+                                          None)),
+    ]
+
+
+# --- Mesure ---------------------------------------------------------------------
+
+# Nombre de requêtes SQL de chaque requête HTTP du scénario en cours
+_query_log = []
+
+
+def instrument(app):
+    """Compte les requêtes SQL exécutées pendant chaque requête HTTP
+
+    Seuls les appels execute() de l'application sont comptés (compteur de
+    InstrumentedConnection), pas les instructions lancées par les triggers.
+    """
+    from flask import g
+    from instrumentation import InstrumentedConnection
+    database.connection_factory = InstrumentedConnection
+
+    def _reset_query_count():
+        g._sql_queries = 0
+        g._sql_time = 0.0
+
+    # En tête des before_request: les requêtes des autres hooks (version de la
+    # hiérarchie, etc.) comptent aussi
+    app.before_request_funcs.setdefault(None, []).insert(0, _reset_query_count)
+
+    @app.after_request
+    def _record_query_count(response):
+        _query_log.append(g.get('_sql_queries', 0))
+        return response
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    # Rang le plus proche (nearest-rank)
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, statuses, queries, elapsed):
+    latencies = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status >= 500),
+        'statuses': {str(s): statuses.count(s) for s in sorted(set(statuses))},
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def run_client(app, scenarios, iterations):
+    """Mesure séquentielle via le client de test Flask (sans réseau)"""
+    client = app.test_client()
+    results = {}
+    for name, make_request in scenarios:
+        _query_log.clear()
+        latencies, statuses = [], []
+        start = time.perf_counter()
+        for _ in range(iterations):
+            method, url, payload = make_request()
+            t0 = time.perf_counter()
+            response = client.open(url, method=method, json=payload)
+            response.get_data()
+            latencies.append(time.perf_counter() - t0)
+            statuses.append(response.status_code)
+        results[name] = summarize(latencies, statuses, list(_query_log),
+                                  time.perf_counter() - start)
+    return results
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Garde la réponse 302 des suppressions, comme le client de test"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def run_server(app, scenarios, iterations, concurrency):
+    """Mesure concurrente contre un vrai serveur HTTP local (multi-thread)"""
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    opener = urllib.request.build_opener(_NoRedirect)
+
+    def call(make_request):
+        method, url, payload = make_request()
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(base + url, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+        t0 = time.perf_counter()
+        try:
+            with opener.open(req) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        return time.perf_counter() - t0, status
+
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for name, make_request in scenarios:
+                _query_log.clear()
+                start = time.perf_counter()
+                samples = list(pool.map(lambda _: call(make_request), range(iterations)))
+                results[name] = summarize([s[0] for s in samples], [s[1] for s in samples],
+                                          list(_query_log), time.perf_counter() - start)
+    finally:
+        server.shutdown()
+    return results
+
+
+def copy_catalog(path):
+    """Copie de travail de la base (WAL compris): les écritures la modifient"""
+    fd, copy = tempfile.mkstemp(prefix='bench-', suffix='.db')
+    os.close(fd)
+    source, target = sqlite3.connect(path), sqlite3.connect(copy)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    return copy
+
+
+def remove_catalog(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def run_benchmark(path, mode='client', iterations=200, concurrency=8, seed=42, routes=None):
+    """Mesure les scénarios sur une copie de path, supprimée ensuite: chaque
+    exécution part du même catalogue"""
+    copy = copy_catalog(path)
+    try:
+        return _run_benchmark(copy, mode, iterations, concurrency, seed, routes)
+    finally:
+        remove_catalog(copy)
+
+
+def _run_benchmark(path, mode, iterations, concurrency, seed, routes):
+    database.DATABASE = path
+    from app import app
+
+    instrument(app)
+    # Les erreurs sont comptées dans le rapport: inutile de les journaliser
+    app.logger.setLevel(logging.CRITICAL)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('categories.sql').setLevel(logging.ERROR)
+
+    conn = database.get_db_connection()
+    shape = {
+        'categories': conn.execute('SELECT COUNT(*) FROM categories').fetchone()[0],
+        'products': conn.execute('SELECT COUNT(*) FROM products').fetchone()[0],
+    }
+    scenarios = build_scenarios(conn, random.Random(seed), iterations)
+    conn.close()
+    if routes:
+        scenarios = [s for s in scenarios if s[0] in routes]
+
+    if mode == 'client':
+        results = run_client(app, scenarios, iterations)
+    else:
+        results = run_server(app, scenarios, iterations, concurrency)
+    return {
+        'meta': {'mode': mode, 'iterations': iterations,
+                 'concurrency': concurrency if mode == 'server' else 1,
+                 'catalog': shape, 'timestamp': time.time()},
+        'routes': results,
+    }
+
+
+# --- Micro-benchmark de sérialisation --------------------------------------------
+
+PRODUCTS_QUERY = PRODUCTS_LISTING.format(where='') + 'LIMIT ?'
+
+
+def serialization_variants(app):
+    """Sérialisations comparées: (nom, fonction(conn, rows) -> corps JSON)"""
+    from serializers import raw_cursor, rows_response
+
+    def fetch_only(conn, rows):
+        # Référence: lecture des tuples bruts, sans sérialisation
+        return raw_cursor(conn, PRODUCTS_QUERY, (rows,)).fetchall()
+
+    def row_dicts(conn, rows):
+        # Chemin historique: sqlite3.Row, dict par ligne puis jsonify
+        products = conn.execute(PRODUCTS_QUERY, (rows,)).fetchall()
+        return app.json.response([dict(product) for product in products]).get_data()
+
+    def direct(conn, rows):
+        return rows_response(raw_cursor(conn, PRODUCTS_QUERY, (rows,))).get_data()
+
+    return [('fetch_only', fetch_only), ('row_dicts', row_dicts), ('direct', direct)]
+
+
+def run_serialization(path, rows=100000, repeat=5):
+    """Temps (meilleur de repeat) et pic mémoire par ligne de chaque variante
+
+    serialize_us_per_row retranche le coût de lecture mesuré par fetch_only.
+    """
+    database.DATABASE = path
+    from app import app
+
+    conn = database.get_db_connection()
+    rows = min(rows, conn.execute('SELECT COUNT(*) FROM products').fetchone()[0])
+    results = {}
+    for name, serialize in serialization_variants(app):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            serialize(conn, rows)
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        body = serialize(conn, rows)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = {
+            'us_per_row': round(min(timings) / max(rows, 1) * 1e6, 3),
+            'peak_bytes_per_row': round(peak / max(rows, 1), 1),
+            'body_bytes': len(body) if isinstance(body, bytes) else None,
+        }
+    conn.close()
+
+    fetch = results.pop('fetch_only')
+    base = results['row_dicts']
+    for stats in results.values():
+        stats['serialize_us_per_row'] = round(stats['us_per_row'] - fetch['us_per_row'], 3)
+        stats['speedup'] = round(base['us_per_row'] / stats['us_per_row'], 2)
+    results = {'fetch_only': fetch, **results}
+    return {'rows': rows, 'variants': results}
+
+
+# --- Comparaison ----------------------------------------------------------------
+
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+
+
+def compare(baseline, current, tolerance=0.15):
+    """Liste des régressions de current par rapport à baseline"""
+    regressions = []
+    for route, base in baseline['routes'].items():
+        now = current['routes'].get(route)
+        if now is None:
+            continue
+        for metric in COMPARED_METRICS:
+            before, after = base.get(metric), now.get(metric)
+            if before is None or after is None:
+                continue
+            if after > before * (1 + tolerance) and after - before > 0.01:
+                regressions.append({'route': route, 'metric': metric,
+                                    'baseline': before, 'current': after})
+        if now.get('errors', 0) > base.get('errors', 0):
+            regressions.append({'route': route, 'metric': 'errors',
+                                'baseline': base.get('errors', 0), 'current': now['errors']})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    gen = commands.add_parser('generate', help='génère un catalogue synthétique')
+    gen.add_argument('path')
+    gen.add_argument('--categories', type=int, default=10000)
+    gen.add_argument('--depth', type=int, default=3)
+    gen.add_argument('--products', type=int, default=1000000)
+    gen.add_argument('--fanout', type=int, default=10)
+    gen.add_argument('--seed', type=int, default=42)
+
+    run = commands.add_parser('run', help='mesure la latence de chaque route')
+    run.add_argument('path')
+    run.add_argument('--mode', choices=['client', 'server'], default='client')
+    run.add_argument('--iterations', type=int, default=200)
+    run.add_argument('--concurrency', type=int, default=8)
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--route', action='append', dest='routes')
+    run.add_argument('--output')
+
+    cmp_ = commands.add_parser('compare', help='compare une exécution à une référence')
+    cmp_.add_argument('baseline')
+    cmp_.add_argument('current')
+    cmp_.add_argument('--tolerance', type=float, default=0.15)
+
+    ser = commands.add_parser('serialize', help='mesure la sérialisation JSON de /api/products')
+    ser.add_argument('path')
+    ser.add_argument('--rows', type=int, default=100000)
+    ser.add_argument('--repeat', type=int, default=5)
+
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        shape = generate_catalog(args.path, args.categories, args.depth, args.products,
+                                 args.fanout, args.seed)
+        print(json.dumps(shape, indent=2))
+        return 0
+    if args.command == 'run':
+        report = run_benchmark(args.path, args.mode, args.iterations, args.concurrency,
+                               args.seed, args.routes)
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output)
+        print(output)
+        return 0
+
+    if args.command == 'serialize':
+        print(json.dumps(run_serialization(args.path, args.rows, args.repeat), indent=2))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.tolerance)
+    print(json.dumps({'regressions': regressions}, indent=2, ensure_ascii=False))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
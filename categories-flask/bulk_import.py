@@ -0,0 +1,251 @@
+import csv
+import io
+import json
+from collections import OrderedDict
+from database import update_product_counts, bump_catalog_version, category_index
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+MAX_LEVEL = 3
+
+
+class ImportRowError(Exception):
+    """Ligne rejetée lors d'un import en masse"""
+
+
+class ImportReport:
+    """Résumé d'un import: compteurs et premières erreurs (mémoire bornée)"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'errors_truncated': self.rejected > len(self.errors),
+        }
+
+
+def iter_rows(stream, fmt):
+    """Lit un flux texte NDJSON ou CSV ligne par ligne: (numéro, dict)"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_num, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_num, None
+                continue
+            yield line_num, row
+    else:
+        raise ValueError(f'Format inconnu: {fmt}')
+
+
+def text_stream(binary_stream):
+    """Adapte un flux binaire (fichier, corps de requête) en flux texte UTF-8"""
+    return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+
+def _clean(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+class _CategoryResolver:
+    """Résout une référence de catégorie (id, identifiant externe ou nom).
+
+    Les résultats sont gardés dans un petit cache LRU pour que la mémoire
+    reste constante quelle que soit la taille du fichier.
+    """
+
+    def __init__(self, conn, max_size=10000):
+        self.conn = conn
+        self.max_size = max_size
+        self._cache = OrderedDict()
+
+    def _remember(self, key, value):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def resolve(self, category_id=None, external_id=None, name=None):
+        """Retourne (id, level) ou lève ImportRowError"""
+        if category_id is not None:
+            key, query, param = ('id', category_id), 'WHERE id = ?', category_id
+        elif external_id is not None:
+            key, query, param = ('ext', str(external_id)), 'WHERE external_id = ?', str(external_id)
+        elif name is not None:
+            key, query, param = ('name', name), 'WHERE name = ?', name
+        else:
+            return None
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        rows = self.conn.execute(
+            f'SELECT id, level FROM categories {query} LIMIT 2', (param,)
+        ).fetchall()
+        if not rows:
+            raise ImportRowError(f'Catégorie introuvable: {param}')
+        if len(rows) > 1:
+            raise ImportRowError(f'Nom de catégorie ambigu: {param}')
+        result = (rows[0]['id'], rows[0]['level'])
+        self._remember(key, result)
+        return result
+
+    def discard(self, key):
+        self._cache.pop(key, None)
+
+
+def _import_categories(conn, rows, report, batch_size):
+    resolver = _CategoryResolver(conn)
+    batch = []
+    pending_refs = set()
+
+    def flush():
+        if batch:
+            conn.executemany(
+                'INSERT INTO categories (name, description, parent_id, level, external_id) '
+                'VALUES (?, ?, ?, ?, ?)',
+                batch
+            )
+            bump_catalog_version(conn, categories=True)
+            conn.commit()
+            report.inserted += len(batch)
+            batch.clear()
+            pending_refs.clear()
+
+    for line, row in rows:
+        try:
+            if not isinstance(row, dict):
+                raise ImportRowError('Ligne illisible')
+            name = _clean(row.get('name'))
+            if not name:
+                raise ImportRowError('Le nom est requis')
+            external_id = _clean(row.get('external_id'))
+            parent_id = _clean(row.get('parent_id'))
+            parent_ext = _clean(row.get('parent_external_id'))
+            parent_name = _clean(row.get('parent'))
+
+            # Le parent peut être dans le lot en attente: on l'insère d'abord
+            if ('ext', parent_ext) in pending_refs or ('name', parent_name) in pending_refs:
+                flush()
+
+            parent = resolver.resolve(parent_id, parent_ext, parent_name)
+            level = parent[1] + 1 if parent else 1
+            if level > MAX_LEVEL:
+                raise ImportRowError('Maximum 3 niveaux de catégories autorisés')
+            if external_id is not None:
+                external_id = str(external_id)
+                if ('ext', external_id) in pending_refs or conn.execute(
+                        'SELECT 1 FROM categories WHERE external_id = ?', (external_id,)
+                ).fetchone():
+                    raise ImportRowError(f'Identifiant externe en double: {external_id}')
+        except ImportRowError as e:
+            report.reject(line, str(e))
+            continue
+
+        batch.append((name, _clean(row.get('description')) or '',
+                      parent[0] if parent else None, level, external_id))
+        # Un nom déjà résolu pourrait devenir ambigu avec cette insertion
+        resolver.discard(('name', name))
+        pending_refs.add(('name', name))
+        if external_id is not None:
+            pending_refs.add(('ext', external_id))
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+
+
+def _import_products(conn, rows, report, batch_size):
+    resolver = _CategoryResolver(conn)
+    batch = []
+
+    def flush():
+        if batch:
+            conn.executemany(
+                'INSERT INTO products (name, description, price, category_id) VALUES (?, ?, ?, ?)',
+                batch
+            )
+            bump_catalog_version(conn)
+            conn.commit()
+            report.inserted += len(batch)
+            batch.clear()
+
+    for line, row in rows:
+        try:
+            if not isinstance(row, dict):
+                raise ImportRowError('Ligne illisible')
+            name = _clean(row.get('name'))
+            price = _clean(row.get('price'))
+            if not name or price is None:
+                raise ImportRowError('Nom, prix et catégorie sont requis')
+            try:
+                price = float(price)
+            except (TypeError, ValueError):
+                raise ImportRowError('Prix invalide')
+            category = resolver.resolve(_clean(row.get('category_id')),
+                                        _clean(row.get('category_external_id')),
+                                        _clean(row.get('category')))
+            if category is None:
+                raise ImportRowError('Nom, prix et catégorie sont requis')
+        except ImportRowError as e:
+            report.reject(line, str(e))
+            continue
+
+        batch.append((name, _clean(row.get('description')) or '', price, category[0]))
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+
+
+IMPORTERS = {
+    'categories': _import_categories,
+    'products': _import_products,
+}
+
+
+def import_stream(conn, kind, stream, fmt, batch_size=BATCH_SIZE):
+    """Importe un flux texte de catégories ou de produits.
+
+    Les lignes sont validées au fil de l'eau et insérées par lots
+    (executemany + commit par lot). Le niveau de chaque catégorie est connu
+    dès la résolution de son parent; les compteurs de produits et l'index
+    de la hiérarchie sont recalculés une seule fois, à la fin.
+    """
+    if kind not in IMPORTERS:
+        raise ValueError(f'Type inconnu: {kind}')
+    report = ImportReport()
+    try:
+        IMPORTERS[kind](conn, iter_rows(stream, fmt), report, batch_size)
+    finally:
+        conn.rollback()
+        if report.inserted:
+            if kind == 'categories':
+                category_index.invalidate()
+            else:
+                update_product_counts()
+    return report
@@ -0,0 +1,240 @@
+import threading
+
+
+class CategoryIndex:
+    """Index en mémoire de la hiérarchie des catégories.
+
+    Chargé en une seule requête, il sert la parenté, le niveau et la
+    détection de cycles sans aller-retour vers SQLite. Il est partagé par
+    tout le processus et doit être patché (add/remove) ou invalidé après
+    chaque écriture sur la table categories.
+    """
+
+    # Protection contre les boucles infinies (même borne que l'ancien parcours SQL)
+    MAX_DEPTH = 10
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._version = None
+        self._names = {}
+        self._parents = {}
+        self._children = {}
+        self._paths = {}
+        self._levels = {}
+
+    def load(self, conn=None):
+        """(Re)charge l'index complet avec une seule requête SELECT"""
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        try:
+            rows = conn.execute('SELECT id, name, parent_id FROM categories').fetchall()
+        finally:
+            if own_conn:
+                conn.close()
+
+        with self._lock:
+            self._names = {}
+            self._parents = {}
+            self._children = {}
+            for row in rows:
+                self._names[row['id']] = row['name']
+                self._parents[row['id']] = row['parent_id']
+                self._children.setdefault(row['id'], [])
+            for category_id, parent_id in self._parents.items():
+                if parent_id is not None:
+                    self._children.setdefault(parent_id, []).append(category_id)
+            self._paths = {}
+            self._levels = {}
+            for category_id in self._names:
+                self._compute(category_id)
+            self._loaded = True
+
+    def invalidate(self):
+        """Force un rechargement complet au prochain accès"""
+        with self._lock:
+            self._loaded = False
+
+    def sync(self, version):
+        """Invalide l'index si la hiérarchie a changé depuis son chargement.
+
+        version est la version de la hiérarchie lue en base; elle change à
+        chaque écriture de catégorie, y compris dans un autre processus.
+        """
+        with self._lock:
+            if self._version != version:
+                self._loaded = False
+                self._version = version
+
+    def _follow(self, version):
+        # Patch local: l'index reste à jour seulement si aucune autre
+        # écriture n'a eu lieu entre-temps (dans un autre processus)
+        if version is None:
+            return
+        if self._version is not None and self._version + 1 == version:
+            self._version = version
+        else:
+            self._loaded = False
+            self._version = version
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+
+    @staticmethod
+    def _key(category_id):
+        # Les identifiants reçus en JSON peuvent être des chaînes ("8"),
+        # que SQLite aurait converties grâce à l'affinité INTEGER
+        try:
+            return int(category_id)
+        except (TypeError, ValueError):
+            return category_id
+
+    def _chain(self, category_id):
+        """Remonte la chaîne des parents (catégorie incluse), de bas en haut"""
+        chain = []
+        seen = set()
+        current_id = category_id
+        while current_id is not None and current_id in self._names and current_id not in seen:
+            seen.add(current_id)
+            chain.append(current_id)
+            current_id = self._parents[current_id]
+        return chain
+
+    def _compute(self, category_id):
+        chain = self._chain(category_id)
+        self._paths[category_id] = " > ".join(self._names[c] for c in reversed(chain))
+        self._levels[category_id] = min(len(chain), self.MAX_DEPTH + 1) if chain else 1
+
+    def add(self, category_id, name, parent_id, version=None):
+        """Ajoute une catégorie fraîchement insérée sans recharger l'index"""
+        self.add_many([(category_id, name, parent_id)], version)
+
+    def add_many(self, rows, version=None):
+        """Ajoute des catégories (id, name, parent_id), parents en premier,
+        insérées par une même écriture"""
+        with self._lock:
+            self._follow(version)
+            if not self._loaded:
+                return
+            for category_id, name, parent_id in rows:
+                self._names[category_id] = name
+                self._parents[category_id] = parent_id
+                self._children.setdefault(category_id, [])
+                if parent_id is not None:
+                    self._children.setdefault(parent_id, []).append(category_id)
+                self._compute(category_id)
+
+    def remove(self, category_id, version=None):
+        """Retire une catégorie (sans enfants) supprimée de la base"""
+        with self._lock:
+            self._follow(version)
+            if not self._loaded:
+                return
+            if self._children.get(category_id):
+                # Les descendants changeraient de chemin: on recharge tout
+                self._loaded = False
+                return
+            parent_id = self._parents.pop(category_id, None)
+            self._names.pop(category_id, None)
+            self._children.pop(category_id, None)
+            self._paths.pop(category_id, None)
+            self._levels.pop(category_id, None)
+            siblings = self._children.get(parent_id)
+            if siblings and category_id in siblings:
+                siblings.remove(category_id)
+
+    def _descendants(self, category_id):
+        # Sous-arbre (catégorie comprise), parents avant enfants
+        order = [category_id]
+        for current_id in order:
+            order.extend(self._children.get(current_id, ()))
+        return order
+
+    def move(self, category_id, parent_id, version=None):
+        """Rattache une catégorie à un nouveau parent; seuls les chemins et
+        niveaux du sous-arbre déplacé sont recalculés"""
+        with self._lock:
+            self._follow(version)
+            if not self._loaded or category_id not in self._names:
+                self._loaded = False
+                return
+            old_parent_id = self._parents[category_id]
+            siblings = self._children.get(old_parent_id)
+            if siblings and category_id in siblings:
+                siblings.remove(category_id)
+            self._parents[category_id] = parent_id
+            if parent_id is not None:
+                self._children.setdefault(parent_id, []).append(category_id)
+            for descendant_id in self._descendants(category_id):
+                self._compute(descendant_id)
+
+    def remove_subtree(self, category_id, version=None):
+        """Retire une catégorie et tous ses descendants supprimés de la base"""
+        with self._lock:
+            self._follow(version)
+            if not self._loaded or category_id not in self._names:
+                return
+            siblings = self._children.get(self._parents[category_id])
+            if siblings and category_id in siblings:
+                siblings.remove(category_id)
+            for descendant_id in self._descendants(category_id):
+                self._names.pop(descendant_id, None)
+                self._parents.pop(descendant_id, None)
+                self._paths.pop(descendant_id, None)
+                self._levels.pop(descendant_id, None)
+                self._children.pop(descendant_id, None)
+
+    def parentage(self, category_id):
+        """Chemin hiérarchique "A > B > C" précalculé"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._paths.get(self._key(category_id), "")
+
+    def level(self, category_id):
+        """Niveau d'une catégorie (1 pour une racine ou une catégorie inconnue)"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._levels.get(self._key(category_id), 1)
+
+    def is_ancestor_or_self(self, ancestor_id, category_id):
+        """Vrai si ancestor_id est category_id ou l'un de ses ancêtres"""
+        self._ensure_loaded()
+        ancestor_id = self._key(ancestor_id)
+        category_id = self._key(category_id)
+        with self._lock:
+            if ancestor_id == category_id:
+                return True
+            return ancestor_id in self._chain(category_id)
+
+    def ancestors(self, category_id):
+        """Identifiants de la catégorie puis de ses ancêtres, jusqu'à la racine"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._chain(self._key(category_id))
+
+    def subtree(self, category_id):
+        """Identifiants de la catégorie et de tous ses descendants (un seul parcours)"""
+        self._ensure_loaded()
+        root = self._key(category_id)
+        with self._lock:
+            if root not in self._names:
+                return set()
+            seen = {root}
+            stack = [root]
+            while stack:
+                for child_id in self._children.get(stack.pop(), ()):
+                    if child_id not in seen:
+                        seen.add(child_id)
+                        stack.append(child_id)
+            return seen
+
+    def children(self, category_id):
+        """Identifiants des sous-catégories directes"""
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._children.get(self._key(category_id), ()))
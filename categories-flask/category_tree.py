@@ -0,0 +1,36 @@
+"""Arbre imbriqué des catégories, construit en O(n) depuis une seule requête."""
+from queries import TREE_ROWS, SUBTREE_ROWS
+
+
+def fetch_tree_rows(conn, root_id=None, depth=None):
+    """Lignes de l'arbre entier, ou du sous-arbre de root_id via la table de
+    fermeture; depth borne le nombre de niveaux renvoyés"""
+    if root_id is None:
+        where, params = ('WHERE c.level <= ?', (depth,)) if depth else ('', ())
+        return conn.execute(TREE_ROWS.format(where=where), params).fetchall()
+
+    where, params = ('AND cc.depth < ?', (root_id, depth)) if depth else ('', (root_id,))
+    return conn.execute(SUBTREE_ROWS.format(where=where), params).fetchall()
+
+
+def build_tree(rows):
+    """Imbrique les lignes en deux passes linéaires.
+
+    Les lignes triées par nom au sein d'un même parent donnent des enfants
+    déjà triés; une ligne dont le parent est absent du résultat devient une
+    racine. product_count est déjà cumulatif (sous-arbre compris).
+    """
+    nodes = {}
+    for row in rows:
+        node = dict(row)
+        node['children'] = []
+        nodes[node['id']] = node
+
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node['parent_id'])
+        if parent is None:
+            roots.append(node)
+        else:
+            parent['children'].append(node)
+    return roots
@@ -0,0 +1,204 @@
+"""Journal des modifications du catalogue (flux /api/changes).
+
+change_log garde une entrée par entité modifiée: chaque insertion, mise à
+jour ou suppression d'une catégorie ou d'un produit remplace l'entrée
+précédente de la même entité par une nouvelle, de numéro (seq) croissant.
+Un client qui connaît le seq de sa dernière synchronisation reçoit donc
+chaque entité modifiée une seule fois, dans son dernier état: "upsert" avec
+l'objet courant, ou "delete" (tombstone).
+
+Le journal est alimenté par triggers, quel que soit le chemin d'écriture, et
+se compacte seul: toutes les COMPACT_EVERY entrées, il ne garde que les
+`changes_retention` plus récentes (catalog_meta). Le plus grand seq supprimé
+devient l'horizon `changes_horizon`: un client plus ancien doit tout
+recharger (resync).
+"""
+import json
+
+DEFAULT_RETENTION = 100000
+COMPACT_EVERY = 1024
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+ENTITIES = {
+    # entité: (table, requête des objets courants par id)
+    'category': ('categories', 'SELECT * FROM categories WHERE id IN (SELECT value FROM json_each(?))'),
+    'product': ('products', '''
+        SELECT p.*, c.name as category_name
+        FROM products p
+        JOIN categories c ON p.category_id = c.id
+        WHERE p.id IN (SELECT value FROM json_each(?))
+    '''),
+}
+
+
+def _log(entity, ref, op):
+    return (f"DELETE FROM change_log WHERE entity = '{entity}' AND entity_id = {ref}.id; "
+            f"INSERT INTO change_log (entity, entity_id, op) VALUES ('{entity}', {ref}.id, '{op}');")
+
+
+def create_change_log(conn, retention=DEFAULT_RETENTION):
+    # Import local: database importe migrations, qui importe ce module
+    from database import create_triggers
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            op TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_change_log_entity
+        ON change_log (entity, entity_id)
+    ''')
+    conn.execute("INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('changes_horizon', 0)")
+    conn.execute("INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('changes_retention', ?)",
+                 (retention,))
+
+    triggers = []
+    for entity, (table, _) in ENTITIES.items():
+        triggers.append(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_ai AFTER INSERT ON {table} BEGIN
+                {_log(entity, 'new', 'upsert')}
+            END
+        ''')
+        triggers.append(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_ad AFTER DELETE ON {table} BEGIN
+                {_log(entity, 'old', 'delete')}
+            END
+        ''')
+    create_triggers(conn, triggers)
+    create_update_triggers(conn)
+
+    # Les lignes existantes entrent au journal: since=0 décrit tout le catalogue
+    for entity, (table, _) in ENTITIES.items():
+        conn.execute(f'''
+            INSERT INTO change_log (entity, entity_id, op)
+            SELECT '{entity}', id, 'upsert' FROM {table} ORDER BY id
+            ON CONFLICT (entity, entity_id) DO NOTHING
+        ''')
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS change_log_compact AFTER INSERT ON change_log
+        WHEN new.seq % {COMPACT_EVERY} = 0 BEGIN
+            {_COMPACT}
+        END
+    ''')
+
+
+def create_update_triggers(conn):
+    """(Re)crée les triggers de mise à jour, gardés par une comparaison des colonnes.
+
+    Une ligne réécrite à l'identique (recalcul complet des compteurs, worker
+    d'agrégation) n'entre pas au journal. La liste des colonnes est figée à
+    la création: à rappeler après tout ajout de colonne.
+    """
+    for entity, (table, _) in ENTITIES.items():
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+        changed = ' OR '.join(f'old.{column} IS NOT new.{column}' for column in columns)
+        conn.execute(f'DROP TRIGGER IF EXISTS {table}_changes_au')
+        conn.execute(f'''
+            CREATE TRIGGER {table}_changes_au AFTER UPDATE ON {table}
+            WHEN {changed} BEGIN
+                {_log(entity, 'new', 'upsert')}
+            END
+        ''')
+
+
+def republish(conn, entity, ids):
+    """Journalise des entités dont l'état publié change sans que leur ligne change
+    (parenté des descendants d'une catégorie déplacée)"""
+    ids = json.dumps(list(ids))
+    conn.execute('DELETE FROM change_log WHERE entity = ? '
+                 'AND entity_id IN (SELECT value FROM json_each(?))', (entity, ids))
+    conn.execute("INSERT INTO change_log (entity, entity_id, op) "
+                 "SELECT ?, value, 'upsert' FROM json_each(?)", (entity, ids))
+
+
+# Avance l'horizon jusqu'au seq qui précède les `changes_retention` plus
+# récents, puis supprime tout ce qui n'est pas au-delà
+_COMPACT = '''
+    UPDATE catalog_meta SET value = MAX(value, COALESCE(
+        (SELECT seq FROM change_log ORDER BY seq DESC LIMIT 1
+         OFFSET (SELECT value FROM catalog_meta WHERE key = 'changes_retention')), 0))
+    WHERE key = 'changes_horizon';
+    DELETE FROM change_log
+    WHERE seq <= (SELECT value FROM catalog_meta WHERE key = 'changes_horizon');
+'''
+
+
+def compact_changes(conn, retention=None):
+    """Compacte le journal immédiatement (retention remplace la valeur stockée)"""
+    if retention is not None:
+        conn.execute("UPDATE catalog_meta SET value = ? WHERE key = 'changes_retention'",
+                     (retention,))
+    for statement in _COMPACT.split(';'):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def _meta(conn, key):
+    row = conn.execute('SELECT value FROM catalog_meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def get_changes(conn, since, limit=DEFAULT_LIMIT, parentage=None):
+    """Modifications de seq > since, au plus limit, avec l'état courant des objets.
+
+    Si since précède l'horizon de compactage, renvoie resync=True: le client
+    recharge les listes complètes puis reprend à next_since. Toutes les
+    lectures se font dans une même transaction: un compactage concurrent ne
+    peut pas supprimer les entrées entre la vérification de l'horizon et leur
+    lecture.
+    """
+    conn.execute('BEGIN')
+    try:
+        return _read_changes(conn, since, limit, parentage)
+    finally:
+        conn.rollback()
+
+
+def _read_changes(conn, since, limit, parentage):
+    horizon = _meta(conn, 'changes_horizon')
+    last_seq = conn.execute('SELECT MAX(seq) FROM change_log').fetchone()[0] or horizon
+    if since < horizon:
+        return {'resync': True, 'changes': [], 'next_since': last_seq, 'has_more': False}
+
+    entries = conn.execute(
+        'SELECT seq, entity, entity_id, op FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?',
+        (since, limit + 1)
+    ).fetchall()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    objects = {}
+    for entity, (_, query) in ENTITIES.items():
+        ids = [e[2] for e in entries if e[1] == entity and e[3] == 'upsert']
+        if ids:
+            objects[entity] = {row['id']: dict(row)
+                               for row in conn.execute(query, (json.dumps(ids),))}
+    if parentage is not None:
+        for category in objects.get('category', {}).values():
+            category['parentage'] = parentage(category['id'])
+
+    changes = []
+    for seq, entity, entity_id, op in entries:
+        change = {'seq': seq, 'type': entity, 'id': entity_id, 'op': op}
+        if op == 'upsert':
+            data = objects.get(entity, {}).get(entity_id)
+            if data is None:
+                # Produit dont la catégorie a disparu: il n'est plus listé
+                change['op'] = 'delete'
+            else:
+                change['data'] = data
+        changes.append(change)
+
+    return {
+        'resync': False,
+        'changes': changes,
+        'next_since': entries[-1][0] if entries else since,
+        'has_more': has_more,
+    }
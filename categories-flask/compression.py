@@ -0,0 +1,139 @@
+"""Compression gzip/deflate des réponses, négociée par Accept-Encoding.
+
+Seules les réponses 200 d'un type textuel (COMPRESSIBLE_TYPES) d'au moins
+`min_size` octets sont compressées. Les corps compressés sont mémorisés: sous
+la version du catalogue servie (g.catalog_version, routes @catalog_etag) ou,
+à défaut, sous l'empreinte du corps (pages HTML du page_cache). Une requête
+répétée sur des données inchangées ne recompresse donc rien.
+
+L'ETag d'une réponse compressée devient faible (W/"..."): le contenu diffère
+octet par octet de la version non compressée, mais reste sémantiquement
+équivalent, et catalog_etag répond 304 aux deux formes.
+"""
+import gzip
+import hashlib
+import threading
+import zlib
+from flask import g, request
+from page_cache import PageCache
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain', 'text/css',
+                      'text/csv', 'application/javascript')
+
+# Ordre de préférence à qualité égale dans Accept-Encoding
+ENCODINGS = ('gzip', 'deflate')
+
+
+def compress(data, encoding, level=6):
+    if encoding == 'gzip':
+        # mtime fixe: mêmes octets pour un même corps, quel que soit le processus
+        return gzip.compress(data, level, mtime=0)
+    return zlib.compress(data, level)
+
+
+def _compress_stream(chunks, encoding, level):
+    # wbits 31: en-tête gzip, 15: format zlib (le "deflate" de HTTP)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31 if encoding == 'gzip' else 15)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class Compressor:
+    """Compression des réponses, avec cache des corps compressés"""
+
+    def __init__(self, min_size=1024, level=6, types=COMPRESSIBLE_TYPES,
+                 cache_size=256, ttl=300):
+        self.min_size = min_size
+        self.level = level
+        self.types = tuple(types)
+        self.cache = PageCache(max_entries=cache_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _cache_key(self, body, encoding):
+        version = g.get('catalog_version')
+        if version is not None:
+            tag = ('catalog', version)
+        else:
+            tag = ('digest', hashlib.blake2b(body, digest_size=16).digest())
+        return (request.path, request.query_string, encoding, tag)
+
+    def _compressed(self, body, encoding):
+        key = self._cache_key(body, encoding)
+        data = self.cache.get(key)
+        if data is None:
+            data = compress(body, encoding, self.level)
+            self.cache.set(key, data)
+        return data
+
+    def process(self, response):
+        """Compresse la réponse si le client l'accepte et qu'elle s'y prête"""
+        if response.mimetype not in self.types:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            # Taille inconnue: flux toujours compressé, à la volée
+            response.response = _compress_stream(response.response, encoding, self.level)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                return response
+            data = self._compressed(body, encoding)
+            response.set_data(data)
+            with self._lock:
+                self.compressed += 1
+                self.bytes_in += len(body)
+                self.bytes_out += len(data)
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def metric_lines(self):
+        """Octets avant et après compression, succès du cache de corps compressés"""
+        stats = self.cache.stats()
+        with self._lock:
+            compressed, bytes_in, bytes_out = self.compressed, self.bytes_in, self.bytes_out
+        return [
+            '# TYPE compression_responses_total counter',
+            f'compression_responses_total {compressed}',
+            '# TYPE compression_bytes_in_total counter',
+            f'compression_bytes_in_total {bytes_in}',
+            '# TYPE compression_bytes_out_total counter',
+            f'compression_bytes_out_total {bytes_out}',
+            '# TYPE compression_cache_hits_total counter',
+            f'compression_cache_hits_total {stats["hits"]}',
+            '# TYPE compression_cache_misses_total counter',
+            f'compression_cache_misses_total {stats["misses"]}',
+        ]
+
+
+def init_compression(app):
+    """Active la compression des réponses sauf si app.config['COMPRESSION'] est faux"""
+    if not app.config.get('COMPRESSION', True):
+        return None
+
+    compressor = Compressor(min_size=app.config.get('COMPRESSION_MIN_SIZE', 1024),
+                            level=app.config.get('COMPRESSION_LEVEL', 6),
+                            types=app.config.get('COMPRESSION_TYPES', COMPRESSIBLE_TYPES),
+                            cache_size=app.config.get('COMPRESSION_CACHE_SIZE', 256),
+                            ttl=app.config.get('COMPRESSION_CACHE_TTL', 300))
+    app.after_request(compressor.process)
+    return compressor
@@ -1,13 +1,145 @@
+import json
 import sqlite3
-import os
+import queue
+import threading
+from flask import g
+from category_index import CategoryIndex
+from migrations import migrate
+from queries import ADJUST_PRODUCT_COUNTS
 
 DATABASE = 'categories.db'
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
+# Pragmas appliqués à chaque connexion (surchargeables via app.config['SQLITE_PRAGMAS'])
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,       # en Kio (valeur négative), soit ~16 Mo
+    'mmap_size': 134217728,     # 128 Mo
+    'busy_timeout': 5000,       # en millisecondes
+}
+# Pragmas effectivement appliqués: les défauts complétés par init_app()
+connection_pragmas = dict(DEFAULT_PRAGMAS)
+
+# Fonctions appelées avec chaque nouvelle connexion (instrumentation, benchmarks)
+connection_hooks = []
+# Classe des connexions ouvertes (remplacée quand l'instrumentation SQL est active)
+connection_factory = sqlite3.Connection
+
+def _open_connection(pragmas=None, read_only=False):
+    conn = sqlite3.connect(DATABASE, check_same_thread=False, factory=connection_factory)
     conn.row_factory = sqlite3.Row
+    for name, value in (pragmas or connection_pragmas).items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    if read_only:
+        conn.execute('PRAGMA query_only = 1')
+    for hook in connection_hooks:
+        hook(conn)
     return conn
 
+def get_db_connection():
+    """Connexion indépendante, hors requête (CLI, initialisation, scripts),
+    avec les mêmes pragmas que les pools"""
+    return _open_connection()
+
+class ConnectionPool:
+    """Pool de connexions SQLite réutilisables entre requêtes.
+
+    Les lectures disposent de plusieurs connexions en lecture seule qui
+    avancent en parallèle grâce au mode WAL; les écritures passent par un
+    pool de taille 1, SQLite n'acceptant qu'un seul écrivain à la fois.
+    """
+
+    def __init__(self, max_size, read_only=False, pragmas=None, timeout=None):
+        self.max_size = max_size
+        self.read_only = read_only
+        self.pragmas = dict(pragmas or connection_pragmas)
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._counter_lock = threading.Lock()
+        self.in_use = 0
+        self.opened = 0
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError('Aucune connexion disponible dans le pool')
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = _open_connection(self.pragmas, read_only=self.read_only)
+            except Exception:
+                self._slots.release()
+                raise
+            with self._counter_lock:
+                self.opened += 1
+        with self._counter_lock:
+            self.in_use += 1
+        return conn
+
+    def release(self, conn):
+        with self._counter_lock:
+            self.in_use -= 1
+        try:
+            # Ne jamais rendre au pool une transaction laissée ouverte
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except sqlite3.Error:
+            conn.close()
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+read_pool = None
+write_pool = None
+
+def init_app(app):
+    """Configure les pools et rend les connexions à la fin de chaque requête"""
+    global read_pool, write_pool, connection_pragmas
+    pragmas = dict(DEFAULT_PRAGMAS)
+    pragmas.update(app.config.get('SQLITE_PRAGMAS', {}))
+    connection_pragmas = pragmas
+    timeout = pragmas['busy_timeout'] / 1000
+    read_pool = ConnectionPool(app.config.get('SQLITE_READ_POOL_SIZE', 8),
+                               read_only=True, pragmas=pragmas, timeout=timeout)
+    write_pool = ConnectionPool(1, pragmas=pragmas, timeout=timeout)
+    app.teardown_appcontext(close_db)
+    app.before_request(sync_category_index)
+
+def sync_category_index():
+    """Recharge l'index si un autre processus a modifié la hiérarchie"""
+    category_index.sync(get_categories_version(get_read_db()))
+
+def get_read_db():
+    """Connexion en lecture seule, réutilisée pendant toute la requête"""
+    if 'read_db' not in g:
+        g.read_db = read_pool.acquire()
+    return g.read_db
+
+def get_write_db():
+    """Connexion d'écriture (unique dans le processus), réutilisée pendant la requête"""
+    if 'write_db' not in g:
+        g.write_db = write_pool.acquire()
+    return g.write_db
+
+def close_db(e=None):
+    read_db = g.pop('read_db', None)
+    if read_db is not None:
+        read_pool.release(read_db)
+    write_db = g.pop('write_db', None)
+    if write_db is not None:
+        write_pool.release(write_db)
+
+# Index de la hiérarchie partagé par tout le processus
+category_index = CategoryIndex(get_db_connection)
+
 def init_db():
     conn = get_db_connection()
     
@@ -20,11 +152,19 @@ def init_db():
             parent_id INTEGER,
             level INTEGER DEFAULT 1,
             product_count INTEGER DEFAULT 0,
+            external_id TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (parent_id) REFERENCES categories (id)
         )
     ''')
     
+    # Identifiant externe (imports en masse), ajouté aux bases existantes
+    _add_column_if_missing(conn, 'categories', 'external_id', 'TEXT')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_external_id
+        ON categories (external_id)
+    ''')
+    
     # Table des produits
     conn.execute('''
         CREATE TABLE IF NOT EXISTS products (
@@ -38,122 +178,231 @@ def init_db():
         )
     ''')
     
+    # Version du catalogue, incrémentée à chaque écriture (ETag des lectures)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('version', 1)")
+    # Version propre à la hiérarchie: resynchronise l'index des autres processus
+    conn.execute("INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('categories_version', 1)")
+    
+    _create_search_index(conn)
+    _create_closure_table(conn)
+    
     conn.commit()
+    # Index et évolutions ultérieures du schéma (PRAGMA user_version)
+    migrate(conn)
     conn.close()
 
-def calculate_category_level(category_id, conn):
-    """Calcule le niveau d'une catégorie"""
-    level = 1
-    current_id = category_id
-    
-    while True:
-        parent = conn.execute(
-            'SELECT parent_id FROM categories WHERE id = ?', 
-            (current_id,)
+def _create_closure_table(conn):
+    """Table de fermeture (ancêtre, descendant, profondeur) de la hiérarchie.
+
+    Chaque catégorie y figure comme son propre ancêtre (profondeur 0). Elle
+    est maintenue par triggers à l'insertion et à la suppression, ce qui
+    couvre aussi les imports en masse.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'category_closure'"
+    ).fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS category_closure (
+            ancestor INTEGER NOT NULL,
+            descendant INTEGER NOT NULL,
+            depth INTEGER NOT NULL,
+            PRIMARY KEY (ancestor, descendant)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_category_closure_descendant
+        ON category_closure (descendant, depth)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_products_category_price
+        ON products (category_id, price)
+    ''')
+    conn.executescript('''
+        CREATE TRIGGER IF NOT EXISTS category_closure_ai AFTER INSERT ON categories BEGIN
+            INSERT INTO category_closure (ancestor, descendant, depth)
+            SELECT ancestor, new.id, depth + 1 FROM category_closure
+            WHERE descendant = new.parent_id
+            UNION ALL
+            SELECT new.id, new.id, 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS category_closure_ad AFTER DELETE ON categories BEGIN
+            DELETE FROM category_closure WHERE descendant = old.id OR ancestor = old.id;
+        END;
+    ''')
+    if not exists:
+        rebuild_category_closure(conn)
+
+def rebuild_category_closure(conn):
+    """Reconstruit entièrement la table de fermeture à partir de parent_id"""
+    conn.execute('DELETE FROM category_closure')
+    conn.execute('''
+        INSERT INTO category_closure (ancestor, descendant, depth)
+        WITH RECURSIVE closure(ancestor, descendant, depth) AS (
+            SELECT id, id, 0 FROM categories
+            UNION
+            SELECT cl.ancestor, c.id, cl.depth + 1
+            FROM categories c
+            INNER JOIN closure cl ON c.parent_id = cl.descendant
+            WHERE cl.depth < 10
+        )
+        SELECT ancestor, descendant, MIN(depth) FROM closure GROUP BY ancestor, descendant
+    ''')
+
+# Tables FTS5 (contenu externe) indexant nom et description, synchronisées par triggers
+SEARCH_TABLES = {
+    'products_fts': 'products',
+    'categories_fts': 'categories',
+}
+
+def _create_search_index(conn):
+    for fts_table, table in SEARCH_TABLES.items():
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts_table,)
         ).fetchone()
-        
-        if parent is None or parent['parent_id'] is None:
-            break
-            
-        level += 1
-        current_id = parent['parent_id']
-        
-        # Protection contre les boucles infinies
-        if level > 10:
-            break
-    
-    return level
+        # Tokenizer sans accents (données en français) et index de préfixes
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                name, description,
+                content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+        conn.executescript(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts_table} (rowid, name, description)
+                VALUES (new.id, new.name, new.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts_table} ({fts_table}, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF name, description ON {table} BEGIN
+                INSERT INTO {fts_table} ({fts_table}, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+                INSERT INTO {fts_table} (rowid, name, description)
+                VALUES (new.id, new.name, new.description);
+            END;
+        ''')
+        if not exists:
+            # Nouvel index sur une base existante: on indexe les données déjà présentes
+            conn.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+
+def rebuild_search_index():
+    """Reconstruit entièrement les index de recherche à partir des tables"""
+    conn = get_db_connection()
+    for fts_table in SEARCH_TABLES:
+        conn.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+    conn.commit()
+    conn.close()
+
+def create_triggers(conn, statements):
+    """Crée des triggers dans la transaction en cours (migrations).
+
+    Un execute par trigger: executescript validerait la transaction en cours.
+    """
+    for statement in statements:
+        conn.execute(statement)
+
+def _add_column_if_missing(conn, table, column, declaration):
+    columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+def get_catalog_version(conn):
+    """Version courante du catalogue (une seule lecture sur catalog_meta)"""
+    row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()
+    return row['value'] if row else 0
+
+def get_categories_version(conn):
+    """Version de la hiérarchie des catégories (modifiée par les seules écritures de catégories)"""
+    row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'categories_version'").fetchone()
+    return row['value'] if row else 0
+
+def bump_catalog_version(conn, categories=False):
+    """Incrémente la version du catalogue dans la transaction d'écriture en cours.
+
+    Avec categories=True, incrémente aussi la version de la hiérarchie et
+    retourne sa nouvelle valeur.
+    """
+    conn.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'version'")
+    if categories:
+        conn.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'categories_version'")
+        return get_categories_version(conn)
+
+def calculate_category_level(category_id, conn=None):
+    """Calcule le niveau d'une catégorie"""
+    return category_index.level(category_id)
+
+def adjust_product_counts(conn, category_id, delta):
+    """Applique un delta au compteur d'une catégorie et de tous ses ancêtres.
+
+    Doit être appelée avec la connexion de l'écriture, avant son commit, pour
+    que le compteur reste cohérent avec la table products.
+    """
+    conn.execute(ADJUST_PRODUCT_COUNTS, (category_id, delta))
+
+def adjust_product_counts_many(conn, deltas):
+    """Applique en une seule requête des deltas {category_id: delta}.
+
+    Les deltas sont propagés aux ancêtres via la table de fermeture puis
+    sommés par catégorie: une catégorie partagée n'est mise à jour qu'une fois.
+    """
+    conn.execute('''
+        UPDATE categories
+        SET product_count = product_count + t.total
+        FROM (
+            SELECT cc.ancestor AS id, SUM(json_extract(d.value, '$[1]')) AS total
+            FROM json_each(?) d
+            INNER JOIN category_closure cc ON cc.descendant = json_extract(d.value, '$[0]')
+            GROUP BY cc.ancestor
+        ) AS t
+        WHERE categories.id = t.id
+    ''', (json.dumps(list(deltas.items())),))
 
 def update_product_counts():
-    """Met à jour le nombre de produits pour chaque catégorie"""
+    """Recalcule entièrement le nombre de produits pour chaque catégorie.
+
+    Reconstruction complète réservée à la réparation et à l'initialisation:
+    les écritures courantes passent par adjust_product_counts().
+    """
     conn = get_db_connection()
     
-    # Reset tous les compteurs
-    conn.execute('UPDATE categories SET product_count = 0')
-    
-    # Compter les produits directs pour chaque catégorie
+    # Une seule passe sur la table de fermeture: seules les catégories dont le
+    # compteur était faux sont réécrites (et republiées par /api/changes)
     conn.execute('''
-        UPDATE categories 
-        SET product_count = (
-            SELECT COUNT(*) 
-            FROM products 
-            WHERE products.category_id = categories.id
-        )
+        UPDATE categories
+        SET product_count = t.total
+        FROM (
+            SELECT cc.ancestor AS id, COUNT(p.id) AS total
+            FROM category_closure cc
+            LEFT JOIN products p ON p.category_id = cc.descendant
+            GROUP BY cc.ancestor
+        ) AS t
+        WHERE categories.id = t.id AND categories.product_count IS NOT t.total
     ''')
     
-    # Ajouter les produits des sous-catégories (récursif)
-    categories = conn.execute('SELECT id FROM categories ORDER BY level DESC').fetchall()
-    
-    for category in categories:
-        # Compter les produits dans les sous-catégories
-        subcategory_products = conn.execute('''
-            WITH RECURSIVE subcategories AS (
-                SELECT id FROM categories WHERE parent_id = ?
-                UNION ALL
-                SELECT c.id FROM categories c
-                INNER JOIN subcategories s ON c.parent_id = s.id
-            )
-            SELECT COUNT(*) as count
-            FROM products p
-            INNER JOIN subcategories s ON p.category_id = s.id
-        ''', (category['id'],)).fetchone()
-        
-        if subcategory_products['count'] > 0:
-            conn.execute('''
-                UPDATE categories 
-                SET product_count = product_count + ? 
-                WHERE id = ?
-            ''', (subcategory_products['count'], category['id']))
-    
+    bump_catalog_version(conn)
     conn.commit()
     conn.close()
 
 def get_category_parentage(category_id):
     """Retourne le chemin hiérarchique d'une catégorie"""
-    conn = get_db_connection()
-    parentage = []
-    current_id = category_id
-    
-    while current_id:
-        category = conn.execute(
-            'SELECT id, name, parent_id FROM categories WHERE id = ?',
-            (current_id,)
-        ).fetchone()
-        
-        if category:
-            parentage.insert(0, category['name'])
-            current_id = category['parent_id']
-        else:
-            break
-    
-    conn.close()
-    return " > ".join(parentage)
+    return category_index.parentage(category_id)
+
+def get_category_subtree(category_id):
+    """Ensemble des identifiants de la catégorie et de ses descendants"""
+    return category_index.subtree(category_id)
 
 def check_circular_reference(category_id, parent_id):
     """Vérifie s'il y a une référence circulaire"""
-    if category_id == parent_id:
-        return True
-    
-    conn = get_db_connection()
-    current_id = parent_id
-    
-    while current_id:
-        if current_id == category_id:
-            conn.close()
-            return True
-            
-        parent = conn.execute(
-            'SELECT parent_id FROM categories WHERE id = ?',
-            (current_id,)
-        ).fetchone()
-        
-        if parent:
-            current_id = parent['parent_id']
-        else:
-            break
-    
-    conn.close()
-    return False
+    return category_index.is_ancestor_or_self(category_id, parent_id)
 
 def create_sample_data():
     """Crée des données d'exemple"""
@@ -220,7 +469,9 @@ def create_sample_data():
                 (name, desc, price, cat_id)
             )
         
+        bump_catalog_version(conn, categories=True)
         conn.commit()
+        category_index.invalidate()
     
     conn.close()
     # Mettre à jour les compteurs de produits
@@ -0,0 +1,238 @@
+"""Facettes de prix matérialisées par catégorie, sous-arbre compris.
+
+category_price_stats garde, pour chaque catégorie, nombre, somme, minimum et
+maximum des prix de son sous-arbre; category_price_buckets le nombre de
+produits par tranche de prix. Les deux tables sont maintenues par triggers à
+l'insertion et à la suppression d'un produit (O(profondeur) lignes), quel que
+soit le chemin d'écriture: routes, imports en masse ou worker d'agrégation.
+Les déplacements et suppressions de sous-arbres (subtrees.py) passent par
+detach_subtree_facets() et attach_subtree_facets().
+
+Les bornes des tranches sont stockées dans price_bucket_bounds: la tranche 0
+couvre les prix sous la première borne, la tranche i les prix à partir de la
+i-ème. Les changer impose rebuild_facets() (flask rebuild-facets).
+"""
+
+DEFAULT_PRICE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000)
+
+# Tranche d'un prix: nombre de bornes inférieures ou égales
+_BUCKET_OF = '(SELECT COUNT(*) FROM price_bucket_bounds b WHERE b.lower <= {price})'
+
+# Ancêtres (catégorie comprise) de la catégorie d'un produit
+_ANCESTORS_OF = 'SELECT ancestor FROM category_closure WHERE descendant = {category}'
+
+# Recalcul du minimum et du maximum, limité aux catégories dont l'extrême a disparu
+_SUBTREE_EXTREMES = '''
+    UPDATE category_price_stats
+    SET price_min = (SELECT MIN(p.price) FROM category_closure cc
+                     INNER JOIN products p ON p.category_id = cc.descendant
+                     WHERE cc.ancestor = category_price_stats.category_id),
+        price_max = (SELECT MAX(p.price) FROM category_closure cc
+                     INNER JOIN products p ON p.category_id = cc.descendant
+                     WHERE cc.ancestor = category_price_stats.category_id)
+    WHERE category_id IN ({ancestors})
+      AND (price_min = old.price OR price_max = old.price)
+'''
+
+
+def create_facet_tables(conn):
+    # Import local: database importe migrations, qui importe ce module
+    from database import create_triggers
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS price_bucket_bounds (
+            bucket INTEGER PRIMARY KEY,
+            lower REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS category_price_stats (
+            category_id INTEGER PRIMARY KEY,
+            product_count INTEGER NOT NULL,
+            price_sum REAL NOT NULL,
+            price_min REAL,
+            price_max REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS category_price_buckets (
+            category_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            product_count INTEGER NOT NULL,
+            PRIMARY KEY (category_id, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+    new_ancestors = _ANCESTORS_OF.format(category='new.category_id')
+    old_ancestors = _ANCESTORS_OF.format(category='old.category_id')
+    create_triggers(conn, [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS products_facets_ai AFTER INSERT ON products BEGIN
+            INSERT INTO category_price_stats
+                (category_id, product_count, price_sum, price_min, price_max)
+            SELECT ancestor, 1, new.price, new.price, new.price
+            FROM ({new_ancestors}) WHERE true
+            ON CONFLICT (category_id) DO UPDATE SET
+                product_count = product_count + 1,
+                price_sum = price_sum + excluded.price_sum,
+                price_min = MIN(COALESCE(price_min, excluded.price_min), excluded.price_min),
+                price_max = MAX(COALESCE(price_max, excluded.price_max), excluded.price_max);
+            INSERT INTO category_price_buckets (category_id, bucket, product_count)
+            SELECT ancestor, {_BUCKET_OF.format(price='new.price')}, 1
+            FROM ({new_ancestors}) WHERE true
+            ON CONFLICT (category_id, bucket) DO UPDATE SET
+                product_count = product_count + 1;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS products_facets_ad AFTER DELETE ON products BEGIN
+            UPDATE category_price_stats
+            SET product_count = product_count - 1, price_sum = price_sum - old.price
+            WHERE category_id IN ({old_ancestors});
+            {_SUBTREE_EXTREMES.format(ancestors=old_ancestors)};
+            UPDATE category_price_buckets SET product_count = product_count - 1
+            WHERE bucket = {_BUCKET_OF.format(price='old.price')}
+              AND category_id IN ({old_ancestors});
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS categories_facets_ad AFTER DELETE ON categories BEGIN
+            DELETE FROM category_price_stats WHERE category_id = old.id;
+            DELETE FROM category_price_buckets WHERE category_id = old.id;
+        END
+        ''',
+    ])
+
+
+def rebuild_facets(conn, bounds=None):
+    """Recalcule toutes les facettes; bounds remplace les bornes des tranches.
+
+    À appeler dans une transaction d'écriture, suivie d'un commit.
+    """
+    if bounds is not None:
+        conn.execute('DELETE FROM price_bucket_bounds')
+        conn.executemany('INSERT INTO price_bucket_bounds (bucket, lower) VALUES (?, ?)',
+                         enumerate(sorted(set(bounds)), start=1))
+    conn.execute('DELETE FROM category_price_stats')
+    conn.execute('DELETE FROM category_price_buckets')
+    conn.execute('''
+        INSERT INTO category_price_stats
+            (category_id, product_count, price_sum, price_min, price_max)
+        SELECT cc.ancestor, COUNT(*), SUM(p.price), MIN(p.price), MAX(p.price)
+        FROM category_closure cc
+        INNER JOIN products p ON p.category_id = cc.descendant
+        GROUP BY cc.ancestor
+    ''')
+    conn.execute(f'''
+        INSERT INTO category_price_buckets (category_id, bucket, product_count)
+        SELECT cc.ancestor, {_BUCKET_OF.format(price='p.price')} AS bucket, COUNT(*)
+        FROM category_closure cc
+        INNER JOIN products p ON p.category_id = cc.descendant
+        GROUP BY cc.ancestor, bucket
+    ''')
+
+
+# Ancêtres stricts d'une catégorie, selon la table de fermeture courante
+_STRICT_ANCESTORS = 'SELECT ancestor FROM category_closure WHERE descendant = :id AND depth > 0'
+
+# Produits d'un ancêtre situés hors du sous-arbre de :id
+_OUTSIDE_SUBTREE = '''
+    FROM category_closure cc
+    INNER JOIN products p ON p.category_id = cc.descendant
+    WHERE cc.ancestor = category_price_stats.category_id
+      AND cc.descendant NOT IN (SELECT descendant FROM category_closure WHERE ancestor = :id)
+'''
+
+
+def detach_subtree_facets(conn, category_id):
+    """Retire les produits du sous-arbre de category_id des facettes de ses
+    ancêtres stricts (déplacement ou suppression du sous-arbre).
+
+    À appeler avant de modifier les liens de fermeture vers ces ancêtres.
+    """
+    stats = conn.execute(
+        'SELECT product_count, price_sum, price_min, price_max '
+        'FROM category_price_stats WHERE category_id = ?', (category_id,)
+    ).fetchone()
+    if not stats or not stats[0]:
+        return
+    params = {'id': category_id, 'count': stats[0], 'sum': stats[1],
+              'min': stats[2], 'max': stats[3]}
+    conn.execute(f'''
+        UPDATE category_price_stats
+        SET product_count = product_count - :count, price_sum = price_sum - :sum
+        WHERE category_id IN ({_STRICT_ANCESTORS})
+    ''', params)
+    # Extrêmes recalculés hors du sous-arbre, seulement là où ils en venaient
+    conn.execute(f'''
+        UPDATE category_price_stats
+        SET price_min = (SELECT MIN(p.price) {_OUTSIDE_SUBTREE}),
+            price_max = (SELECT MAX(p.price) {_OUTSIDE_SUBTREE})
+        WHERE category_id IN ({_STRICT_ANCESTORS})
+          AND (price_min = :min OR price_max = :max)
+    ''', params)
+    conn.execute(f'''
+        UPDATE category_price_buckets
+        SET product_count = category_price_buckets.product_count - b.product_count
+        FROM (SELECT bucket, product_count FROM category_price_buckets
+              WHERE category_id = :id) AS b
+        WHERE category_price_buckets.bucket = b.bucket
+          AND category_price_buckets.category_id IN ({_STRICT_ANCESTORS})
+    ''', params)
+
+
+def attach_subtree_facets(conn, category_id):
+    """Ajoute les produits du sous-arbre de category_id aux facettes de ses
+    nouveaux ancêtres stricts, une fois les liens de fermeture créés"""
+    params = {'id': category_id}
+    conn.execute(f'''
+        INSERT INTO category_price_stats
+            (category_id, product_count, price_sum, price_min, price_max)
+        SELECT a.ancestor, s.product_count, s.price_sum, s.price_min, s.price_max
+        FROM ({_STRICT_ANCESTORS}) a, category_price_stats s
+        WHERE s.category_id = :id AND s.product_count > 0
+        ON CONFLICT (category_id) DO UPDATE SET
+            product_count = product_count + excluded.product_count,
+            price_sum = price_sum + excluded.price_sum,
+            price_min = MIN(COALESCE(price_min, excluded.price_min), excluded.price_min),
+            price_max = MAX(COALESCE(price_max, excluded.price_max), excluded.price_max)
+    ''', params)
+    conn.execute(f'''
+        INSERT INTO category_price_buckets (category_id, bucket, product_count)
+        SELECT a.ancestor, b.bucket, b.product_count
+        FROM ({_STRICT_ANCESTORS}) a, category_price_buckets b
+        WHERE b.category_id = :id AND b.product_count > 0
+        ON CONFLICT (category_id, bucket) DO UPDATE SET
+            product_count = product_count + excluded.product_count
+    ''', params)
+
+
+def get_bucket_bounds(conn):
+    return [row[0] for row in conn.execute('SELECT lower FROM price_bucket_bounds ORDER BY bucket')]
+
+
+def get_facets(conn, category_id):
+    """Facettes d'une catégorie: lectures par clé, indépendantes de la taille du sous-arbre"""
+    stats = conn.execute(
+        'SELECT product_count, price_sum, price_min, price_max '
+        'FROM category_price_stats WHERE category_id = ?', (category_id,)
+    ).fetchone()
+    counts = dict(conn.execute(
+        'SELECT bucket, product_count FROM category_price_buckets WHERE category_id = ?',
+        (category_id,)
+    ).fetchall())
+    count = stats[0] if stats else 0
+
+    bounds = get_bucket_bounds(conn)
+    edges = [None] + bounds + [None]
+    return {
+        'category_id': category_id,
+        'product_count': count,
+        'price': {
+            'min': stats[2] if count else None,
+            'max': stats[3] if count else None,
+            'avg': round(stats[1] / count, 2) if count else None,
+        },
+        'buckets': [{'min': edges[i], 'max': edges[i + 1], 'count': counts.get(i, 0)}
+                    for i in range(len(bounds) + 1)],
+    }
@@ -0,0 +1,31 @@
+from functools import wraps
+from flask import g, make_response, request
+from database import get_read_db, get_catalog_version
+
+
+def catalog_etag(view):
+    """ETag fort dérivé de la version du catalogue, avec réponse 304.
+
+    Seule la table catalog_meta est lue avant de répondre 304: les tables
+    categories et products ne sont touchées que si le client est périmé.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = get_catalog_version(get_read_db())
+        g.catalog_version = version
+        etag = f'catalog-{version}'
+
+        # Forme faible acceptée: ETag d'une réponse compressée (compression.py)
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            # La vue peut servir une version antérieure (instantané en retard)
+            etag = f'catalog-{g.catalog_version}'
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    return wrapper
@@ -0,0 +1,170 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from flask import Response, g, has_app_context, request
+import database
+
+logger = logging.getLogger('categories.sql')
+
+# Bornes (en secondes) des histogrammes de latence par route
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Forme canonique d'une requête: espaces réduits, littéraux remplacés par ?"""
+    return _SPACE_RE.sub(' ', _LITERAL_RE.sub('?', sql)).strip()
+
+
+class Metrics:
+    """Compteurs et histogrammes du processus, au format texte Prometheus"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._routes = {}
+        self.connections_opened = 0
+        self.collectors = []
+
+    def observe_request(self, route, duration, queries, sql_time):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0,
+                    'queries': 0, 'sql_time': 0.0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    stats['buckets'][i] += 1
+            stats['count'] += 1
+            stats['sum'] += duration
+            stats['queries'] += queries
+            stats['sql_time'] += sql_time
+
+    def connection_opened(self, conn):
+        with self._lock:
+            self.connections_opened += 1
+
+    def render(self):
+        with self._lock:
+            routes = {route: dict(stats, buckets=list(stats['buckets']))
+                      for route, stats in self._routes.items()}
+            opened = self.connections_opened
+
+        lines = [
+            '# HELP http_request_duration_seconds Latence des requêtes HTTP par route',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for route, stats in sorted(routes.items()):
+            label = escape_label(route)
+            for bound, count in zip(self.buckets, stats['buckets']):
+                lines.append(f'http_request_duration_seconds_bucket{{route="{label}",le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{route="{label}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'http_request_duration_seconds_sum{{route="{label}"}} {stats["sum"]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{route="{label}"}} {stats["count"]}')
+
+        lines += ['# HELP sql_queries_total Requêtes SQL exécutées par route',
+                  '# TYPE sql_queries_total counter']
+        lines += [f'sql_queries_total{{route="{escape_label(r)}"}} {s["queries"]}'
+                  for r, s in sorted(routes.items())]
+        lines += ['# HELP sql_query_duration_seconds_total Temps passé en SQL par route',
+                  '# TYPE sql_query_duration_seconds_total counter']
+        lines += [f'sql_query_duration_seconds_total{{route="{escape_label(r)}"}} {s["sql_time"]:.6f}'
+                  for r, s in sorted(routes.items())]
+
+        lines += ['# HELP sqlite_connections_opened_total Connexions SQLite ouvertes',
+                  '# TYPE sqlite_connections_opened_total counter',
+                  f'sqlite_connections_opened_total {opened}',
+                  '# HELP sqlite_pool_connections_in_use Connexions empruntées au pool',
+                  '# TYPE sqlite_pool_connections_in_use gauge']
+        for name, pool in (('read', database.read_pool), ('write', database.write_pool)):
+            if pool is not None:
+                lines.append(f'sqlite_pool_connections_in_use{{pool="{name}"}} {pool.in_use}')
+
+        for collector in self.collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    """Échappe une valeur d'étiquette Prometheus (antislash et guillemet)"""
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connexion SQLite qui chronomètre chaque requête exécutée"""
+
+    slow_query_threshold = 0.1
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_query(sql, time.perf_counter() - start)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _record_query(sql_script, time.perf_counter() - start)
+
+
+def _record_query(sql, duration):
+    if has_app_context() and '_sql_queries' in g:
+        g._sql_queries += 1
+        g._sql_time += duration
+    if duration >= InstrumentedConnection.slow_query_threshold:
+        logger.warning('Requête lente (%.1f ms): %s', duration * 1000, normalize_sql(sql))
+
+
+metrics = Metrics()
+
+
+def init_instrumentation(app):
+    """Active l'instrumentation si app.config['INSTRUMENTATION'] est vrai.
+
+    Désactivée, aucune requête HTTP ni SQL n'est chronométrée: /metrics
+    n'expose alors que les compteurs de connexions et de cache.
+    """
+    app.add_url_rule('/metrics', 'metrics', lambda: Response(
+        metrics.render(), mimetype='text/plain; version=0.0.4'))
+    database.connection_hooks.append(metrics.connection_opened)
+
+    if not app.config.get('INSTRUMENTATION', False):
+        return
+
+    InstrumentedConnection.slow_query_threshold = app.config.get('SLOW_QUERY_MS', 100) / 1000
+    database.connection_factory = InstrumentedConnection
+
+    @app.before_request
+    def _start_timer():
+        g._request_start = time.perf_counter()
+        g._sql_queries = 0
+        g._sql_time = 0.0
+
+    @app.after_request
+    def _record_request(response):
+        if '_request_start' not in g:
+            return response
+        duration = time.perf_counter() - g._request_start
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe_request(route, duration, g._sql_queries, g._sql_time)
+        response.headers['Server-Timing'] = (
+            f'db;dur={g._sql_time * 1000:.2f};desc="{g._sql_queries} queries", '
+            f'app;dur={duration * 1000:.2f}'
+        )
+        return response
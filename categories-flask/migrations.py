@@ -0,0 +1,145 @@
+"""Migrations de schéma versionnées par PRAGMA user_version.
+
+Chaque migration porte le numéro de version qu'elle fait atteindre; migrate()
+applique dans l'ordre celles qui dépassent la version de la base, chacune dans
+sa propre transaction avec la mise à jour de user_version.
+
+check_query_plans() vérifie, via EXPLAIN QUERY PLAN, que les requêtes chaudes
+passent par un index (commande CLI: flask --app app check-query-plans).
+"""
+import re
+from changes import create_change_log, create_update_triggers
+from facets import create_facet_tables, rebuild_facets, DEFAULT_PRICE_BUCKETS
+from queries import (INDEX_CATEGORIES, SUBCATEGORIES, CATEGORY_PRODUCTS, AVAILABLE_PARENTS,
+                     CATEGORIES_LISTING, PRODUCTS_LISTING, CATEGORY_PRODUCTS_PAGE,
+                     SUBTREE_PRODUCTS_PAGE, TREE_ROWS, SUBTREE_ROWS, SEARCH_PRODUCTS,
+                     SEARCH_CATEGORIES, ADJUST_PRODUCT_COUNTS, CATEGORY_CHILD_COUNT,
+                     CATEGORY_PRODUCT_COUNT)
+
+
+def _add_hot_query_indexes(conn):
+    # Sous-catégories d'un parent triées par nom, jointures récursives sur parent_id
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_categories_parent_name '
+                 'ON categories (parent_id, name)')
+    # Liste des catégories: ORDER BY level, name, id
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_categories_level_name '
+                 'ON categories (level, name)')
+    # Produits d'une catégorie triés par nom
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_category_name '
+                 'ON products (category_id, name)')
+    # Liste des produits: ORDER BY name, id
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_name ON products (name)')
+
+
+def _add_price_facets(conn):
+    create_facet_tables(conn)
+    rebuild_facets(conn, DEFAULT_PRICE_BUCKETS)
+
+
+# (version atteinte, description, fonction(conn)), dans l'ordre d'application
+MIGRATIONS = [
+    (1, 'Index des requêtes de hiérarchie et de listing', _add_hot_query_indexes),
+    (2, 'Facettes de prix par sous-arbre', _add_price_facets),
+    (3, 'Journal des modifications (/api/changes)', create_change_log),
+    (4, 'Mises à jour à l\'identique absentes du journal', create_update_triggers),
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Applique les migrations en attente; renvoie les versions appliquées.
+
+    La connexion ne doit pas avoir de transaction ouverte. Le verrou pris par
+    BEGIN IMMEDIATE empêche deux processus d'appliquer la même migration.
+    """
+    applied = []
+    for version, _, apply in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Un autre processus a pu migrer pendant l'attente du verrou
+            if version > schema_version(conn):
+                apply(conn)
+                conn.execute(f'PRAGMA user_version = {int(version)}')
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+
+# --- Vérification des plans d'exécution --------------------------------------
+
+# Étapes de plan tolérées quand la requête ne peut pas faire mieux
+SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+# (nom, requête, paramètres, étapes autorisées): un parcours "SCAN x" sans index
+# ou un tri par B-tree temporaire n'est accepté que s'il figure dans les étapes
+# autorisées (CTE, table FTS interrogée par MATCH, tri inhérent à la requête).
+# Les requêtes sont celles qu'exécutent les routes, importées de queries.py
+HOT_QUERIES = [
+    ('index', INDEX_CATEGORIES, (), ()),
+    ('subcategories', SUBCATEGORIES, (1,), ()),
+    ('category_products', CATEGORY_PRODUCTS, (1,), ()),
+    # Presque toutes les catégories sont candidates: le parcours complet est
+    # moins coûteux qu'un index peu sélectif suivi d'un accès par ligne
+    ('available_parents', AVAILABLE_PARENTS, (), ('SCAN categories',)),
+    ('categories_listing', CATEGORIES_LISTING.format(where='') + ' LIMIT ?', (100,), ()),
+    ('products_listing', PRODUCTS_LISTING.format(where='') + ' LIMIT ?', (100,), ()),
+    ('products_listing_after',
+     PRODUCTS_LISTING.format(where='WHERE (p.name, p.id) > (?, ?)') + ' LIMIT ?',
+     ('a', 0, 100), ()),
+    ('category_products_page',
+     CATEGORY_PRODUCTS_PAGE.format(keyset='AND (p.name, p.id) > (?, ?)', order='p.name, p.id'),
+     (1, 'a', 0, 100), ()),
+    ('category_products_by_price',
+     CATEGORY_PRODUCTS_PAGE.format(keyset='AND (p.price, p.id) < (?, ?)',
+                                   order='p.price DESC, p.id DESC'),
+     (1, 10, 0, 100), ()),
+    # Les produits de plusieurs catégories sont fusionnés: le tri, borné par
+    # LIMIT, est inhérent au sous-arbre
+    ('subtree_products_page',
+     SUBTREE_PRODUCTS_PAGE.format(keyset='', order='p.name, p.id'), (1, 100), (SORT,)),
+    ('tree', TREE_ROWS.format(where=''), (), ()),
+    ('tree_levels', TREE_ROWS.format(where='WHERE c.level <= ?'), (2,), ()),
+    ('subtree', SUBTREE_ROWS.format(where=''), (1,), (SORT,)),
+    # Classement par pertinence: le tri sur le score BM25 ne peut pas être indexé
+    ('search_products', SEARCH_PRODUCTS.format(where=''), ('"a"*', 20, 0),
+     ('SCAN products_fts', SORT)),
+    ('search_categories', SEARCH_CATEGORIES.format(where=''), ('"a"*', 20, 0),
+     ('SCAN categories_fts', SORT)),
+    ('adjust_product_counts', ADJUST_PRODUCT_COUNTS, (1, 1), ('SCAN ancestors', 'SCAN a')),
+    ('category_child_count', CATEGORY_CHILD_COUNT, (1,), ()),
+    ('category_product_count', CATEGORY_PRODUCT_COUNT, (1,), ()),
+]
+
+_SCAN_RE = re.compile(r'^SCAN (?!CONSTANT ROW)(\S+)')
+
+
+def query_plan(conn, sql, params=()):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """Renvoie (nom, plan, problèmes) pour chaque requête chaude.
+
+    Problèmes relevés: parcours complet d'une table sans index et tri par
+    B-tree temporaire (ORDER BY non couvert par un index).
+    """
+    results = []
+    for name, sql, params, allowed in queries:
+        plan = query_plan(conn, sql, params)
+        problems = []
+        for detail in plan:
+            scan = _SCAN_RE.match(detail)
+            if scan and 'USING' not in detail and scan.group(0) not in allowed:
+                problems.append(detail)
+            elif detail.startswith(SORT) and SORT not in allowed:
+                problems.append(detail)
+        results.append((name, plan, problems))
+    return results
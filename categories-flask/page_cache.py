@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, request, session
+
+
+class PageCache:
+    """Cache LRU borné, avec TTL, des pages HTML rendues.
+
+    Chaque entrée porte des étiquettes ("index", "category:<id>") qui
+    permettent aux routes d'écriture d'invalider précisément les pages
+    concernées. Le cache est propre au processus: le TTL borne la durée
+    pendant laquelle une écriture faite par un autre processus reste
+    invisible.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tags = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, *tags):
+        """Supprime toutes les entrées portant au moins une des étiquettes"""
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def metric_lines(self):
+        """Succès, échecs et nombre d'entrées du cache de pages, pour /metrics"""
+        stats = self.stats()
+        return [
+            '# TYPE page_cache_hits_total counter',
+            f'page_cache_hits_total {stats["hits"]}',
+            '# TYPE page_cache_misses_total counter',
+            f'page_cache_misses_total {stats["misses"]}',
+            '# TYPE page_cache_entries gauge',
+            f'page_cache_entries {stats["entries"]}',
+        ]
+
+    def cached(self, tags):
+        """Décorateur de vue: tags(**view_args) donne les étiquettes de la page"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Les messages flash sont propres à la session: pas de cache
+                if '_flashes' in session:
+                    return view(*args, **kwargs)
+
+                key = (request.endpoint, tuple(sorted(kwargs.items())),
+                       request.query_string)
+                cached = self.get(key)
+                if cached is not None:
+                    body, mimetype = cached
+                    return Response(body, mimetype=mimetype)
+
+                response = view(*args, **kwargs)
+                if isinstance(response, str):
+                    self.set(key, (response, 'text/html'), tags(**kwargs))
+                return response
+            return wrapper
+        return decorator
+
+
+def category_tags(category_ids):
+    """Étiquettes des pages de catégories à invalider (plus la page d'accueil)"""
+    return ['index'] + [f'category:{category_id}' for category_id in category_ids]
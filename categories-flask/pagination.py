@@ -0,0 +1,106 @@
+import base64
+import binascii
+import json
+from flask import Response, current_app, stream_with_context
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK_SIZE = 500
+
+
+class PageRequest:
+    """Paramètres de pagination par clé (keyset) lus dans la query string"""
+
+    def __init__(self, limit=None, after=None, stream=False):
+        self.limit = limit
+        self.after = after
+        self.stream = stream
+
+    @property
+    def paginated(self):
+        return self.limit is not None
+
+
+def encode_cursor(values):
+    """Encode la clé de tri de la dernière ligne en curseur opaque"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, key_size):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, ValueError):
+        raise ValueError('Curseur invalide')
+    if not isinstance(values, list) or len(values) != key_size:
+        raise ValueError('Curseur invalide')
+    # Seules des valeurs scalaires peuvent être liées aux paramètres SQL
+    if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+        raise ValueError('Curseur invalide')
+    return values
+
+
+def parse_page_args(args, key_size):
+    """Construit un PageRequest; lève ValueError si limit ou cursor est invalide.
+
+    Sans limit ni cursor, la liste complète est renvoyée comme avant.
+    """
+    stream = args.get('stream', '').lower() in ('1', 'true', 'yes')
+    cursor = args.get('cursor')
+    limit = args.get('limit')
+
+    after = decode_cursor(cursor, key_size) if cursor else None
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('Paramètre limit invalide')
+        if limit < 1:
+            raise ValueError('Paramètre limit invalide')
+        limit = min(limit, MAX_PAGE_SIZE)
+    elif cursor and not stream:
+        limit = DEFAULT_PAGE_SIZE
+
+    return PageRequest(limit, after, stream)
+
+
+def keyset_clause(columns, after, descending=False, keyword='WHERE'):
+    """Clause WHERE "(a, b) > (?, ?)" correspondant à l'ORDER BY sur columns
+
+    keyword='AND' permet de l'ajouter à une clause WHERE existante.
+    """
+    if after is None:
+        return '', ()
+    placeholders = ', '.join('?' for _ in columns)
+    operator = '<' if descending else '>'
+    return f"{keyword} ({', '.join(columns)}) {operator} ({placeholders})", tuple(after)
+
+
+def page_envelope(rows, limit, key, serialize=dict):
+    """Page de résultats: rows doit contenir jusqu'à limit + 1 lignes"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'items': [serialize(row) for row in rows],
+        'next_cursor': encode_cursor(key(rows[-1])) if has_more else None,
+    }
+
+
+def stream_json_array(cursor, serialize=dict):
+    """Réponse JSON produite au fil du curseur, sans matérialiser la liste"""
+    dumps = current_app.json.dumps
+
+    def generate():
+        yield '['
+        first = True
+        while True:
+            rows = cursor.fetchmany(STREAM_CHUNK_SIZE)
+            if not rows:
+                break
+            chunk = ','.join(dumps(serialize(row)) for row in rows)
+            yield chunk if first else ',' + chunk
+            first = False
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,109 @@
+"""Requêtes SQL partagées entre les routes, l'instantané et les benchmarks.
+
+Une seule copie de chaque requête: l'instantané produit exactement le JSON
+des routes qu'il remplace.
+{where} reçoit une clause de pagination par clé (keyset_clause) ou ''.
+"""
+
+PRODUCTS_LISTING = '''
+    SELECT p.*, c.name as category_name
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+    {where}
+    ORDER BY p.name, p.id
+'''
+
+CATEGORIES_LISTING = 'SELECT * FROM categories {where} ORDER BY level, name, id'
+
+# Page d'accueil: catégories avec le nom de leur parent direct
+INDEX_CATEGORIES = '''
+    SELECT c.*,
+           CASE
+               WHEN c.parent_id IS NULL THEN c.name
+               ELSE (SELECT name FROM categories p WHERE p.id = c.parent_id) || ' > ' || c.name
+           END as parentage_simple
+    FROM categories c
+    ORDER BY c.level, c.name
+'''
+
+# Page d'une catégorie: produits et sous-catégories directs
+CATEGORY_PRODUCTS = 'SELECT * FROM products WHERE category_id = ? ORDER BY name'
+SUBCATEGORIES = 'SELECT * FROM categories WHERE parent_id = ? ORDER BY name'
+
+# Parents possibles d'une catégorie (niveau 3 au plus pour l'enfant)
+AVAILABLE_PARENTS = 'SELECT * FROM categories WHERE level < 3 ORDER BY id'
+
+# Page de produits d'une catégorie seule ou de tout son sous-arbre (table de
+# fermeture); {keyset} vient de keyset_clause(keyword='AND') et {order} liste
+# les colonnes de tri
+CATEGORY_PRODUCTS_PAGE = '''
+    SELECT p.*, c.name AS category_name
+    FROM products p
+    JOIN categories c ON c.id = p.category_id
+    WHERE p.category_id = ? {keyset}
+    ORDER BY {order}
+    LIMIT ?
+'''
+SUBTREE_PRODUCTS_PAGE = '''
+    SELECT p.*, c.name AS category_name
+    FROM category_closure cc
+    JOIN products p ON p.category_id = cc.descendant
+    JOIN categories c ON c.id = p.category_id
+    WHERE cc.ancestor = ? {keyset}
+    ORDER BY {order}
+    LIMIT ?
+'''
+
+# Arbre des catégories: entier ({where} borne éventuellement le niveau) ou
+# sous-arbre d'une racine ({where} borne éventuellement la profondeur).
+# L'arbre entier suit l'index (parent_id, name): les frères restent triés par nom
+TREE_COLUMNS = 'c.id, c.name, c.description, c.parent_id, c.level, c.product_count'
+TREE_ROWS = f'SELECT {TREE_COLUMNS} FROM categories c {{where}} ORDER BY c.parent_id, c.name, c.id'
+SUBTREE_ROWS = f'''
+    SELECT {TREE_COLUMNS}
+    FROM category_closure cc
+    INNER JOIN categories c ON c.id = cc.descendant
+    WHERE cc.ancestor = ? {{where}}
+    ORDER BY c.name, c.id
+'''
+
+# Recherche plein texte classée par BM25; le nom pèse plus que la description.
+# {where} restreint éventuellement les résultats à un sous-arbre (json_each)
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+SEARCH_PRODUCTS = f'''
+    SELECT p.*, c.name AS category_name,
+           bm25(products_fts, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}) AS score
+    FROM products_fts
+    JOIN products p ON p.id = products_fts.rowid
+    JOIN categories c ON c.id = p.category_id
+    WHERE products_fts MATCH ?{{where}}
+    ORDER BY score
+    LIMIT ? OFFSET ?
+'''
+SEARCH_CATEGORIES = f'''
+    SELECT c.*, bm25(categories_fts, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}) AS score
+    FROM categories_fts
+    JOIN categories c ON c.id = categories_fts.rowid
+    WHERE categories_fts MATCH ?{{where}}
+    ORDER BY score
+    LIMIT ? OFFSET ?
+'''
+
+# Compteur de produits propagé à une catégorie et à tous ses ancêtres
+ADJUST_PRODUCT_COUNTS = '''
+    WITH RECURSIVE ancestors(id) AS (
+        SELECT ?
+        UNION
+        SELECT c.parent_id FROM categories c
+        INNER JOIN ancestors a ON c.id = a.id
+        WHERE c.parent_id IS NOT NULL
+    )
+    UPDATE categories
+    SET product_count = product_count + ?
+    WHERE id IN (SELECT id FROM ancestors)
+'''
+
+# Garde-fous de la suppression d'une catégorie
+CATEGORY_CHILD_COUNT = 'SELECT COUNT(*) FROM categories WHERE parent_id = ?'
+CATEGORY_PRODUCT_COUNT = 'SELECT COUNT(*) FROM products WHERE category_id = ?'
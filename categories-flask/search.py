@@ -0,0 +1,46 @@
+import json
+import re
+from database import get_category_subtree
+from queries import SEARCH_PRODUCTS, SEARCH_CATEGORIES
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_query(text):
+    """Transforme la saisie utilisateur en requête FTS5 sûre.
+
+    Chaque mot devient un terme entre guillemets avec recherche par préfixe,
+    les termes étant combinés en ET. Retourne None si aucun mot exploitable.
+    """
+    tokens = _TOKEN_RE.findall(text or '')
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _subtree_filter(column, category_id):
+    if category_id is None:
+        return '', ()
+    subtree = sorted(get_category_subtree(category_id))
+    return f' AND {column} IN (SELECT value FROM json_each(?))', (json.dumps(subtree),)
+
+
+def search_products(conn, match, category_id=None, limit=DEFAULT_LIMIT, offset=0):
+    where, params = _subtree_filter('p.category_id', category_id)
+    rows = conn.execute(SEARCH_PRODUCTS.format(where=where), (match,) + params + (limit, offset)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def search_categories(conn, match, category_id=None, limit=DEFAULT_LIMIT, offset=0):
+    where, params = _subtree_filter('c.id', category_id)
+    rows = conn.execute(SEARCH_CATEGORIES.format(where=where), (match,) + params + (limit, offset)).fetchall()
+    return [dict(row) for row in rows]
+
+
+SEARCHES = {
+    'products': search_products,
+    'categories': search_categories,
+}
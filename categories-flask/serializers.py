@@ -0,0 +1,90 @@
+"""Sérialisation JSON directe des lignes SQLite.
+
+Les lignes sont lues en tuples bruts (row_factory désactivée sur le curseur)
+et écrites en JSON sans passer par sqlite3.Row, dict ni jsonify. La sortie est
+identique à celle de jsonify (clés triées, séparateurs compacts, ASCII).
+"""
+import json
+from json.encoder import encode_basestring_ascii
+from flask import Response, current_app, stream_with_context
+from pagination import encode_cursor, STREAM_CHUNK_SIZE
+
+_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: float.__repr__,
+    type(None): lambda value: 'null',
+}
+
+
+class RowSerializer:
+    """Encodeur JSON des lignes d'une requête, préparé une fois par requête"""
+
+    def __init__(self, description):
+        names = [column[0] for column in description]
+        self.index = {name: position for position, name in enumerate(names)}
+        order = sorted(range(len(names)), key=names.__getitem__)
+        self._columns = [
+            (position, ('{' if i == 0 else ',') + encode_basestring_ascii(names[position]) + ':')
+            for i, position in enumerate(order)
+        ]
+
+    def encode(self, row):
+        parts = []
+        for position, prefix in self._columns:
+            value = row[position]
+            encoder = _ENCODERS.get(type(value))
+            parts.append(prefix)
+            parts.append(encoder(value) if encoder else json.dumps(value))
+        parts.append('}')
+        return ''.join(parts)
+
+    def encode_many(self, rows):
+        return ','.join(map(self.encode, rows))
+
+
+def raw_cursor(conn, query, params=()):
+    """Exécute query (via conn.execute, instrumentée) sur un curseur à tuples bruts"""
+    cursor = conn.execute(query, params)
+    cursor.row_factory = None
+    return cursor
+
+
+def rows_response(cursor):
+    """Tableau JSON de toutes les lignes du curseur"""
+    serializer = RowSerializer(cursor.description)
+    body = '[' + serializer.encode_many(cursor.fetchall()) + ']\n'
+    return Response(body, mimetype='application/json')
+
+
+def page_response(cursor, limit, key_columns):
+    """Page {"items", "next_cursor"}: le curseur doit fournir jusqu'à limit + 1 lignes"""
+    serializer = RowSerializer(cursor.description)
+    rows = cursor.fetchmany(limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor([last[serializer.index[name]] for name in key_columns])
+    body = ('{"items":[' + serializer.encode_many(rows) + '],"next_cursor":'
+            + current_app.json.dumps(next_cursor) + '}\n')
+    return Response(body, mimetype='application/json')
+
+
+def stream_rows(cursor):
+    """Flux JSON produit au fil du curseur, par blocs de STREAM_CHUNK_SIZE lignes"""
+    serializer = RowSerializer(cursor.description)
+
+    def generate():
+        yield '['
+        separator = ''
+        while True:
+            rows = cursor.fetchmany(STREAM_CHUNK_SIZE)
+            if not rows:
+                break
+            yield separator + serializer.encode_many(rows)
+            separator = ','
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
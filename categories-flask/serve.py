@@ -0,0 +1,253 @@
+"""Point d'entrée de production: serveur multi-processus (prefork).
+
+    python serve.py --workers 4 --port 8000
+    python serve.py --init-db --seed-sample-data --rebuild-counts
+
+Le processus maître initialise éventuellement la base, charge les caches
+partagés (index de la hiérarchie), ouvre la socket d'écoute puis lance les
+workers, qui héritent des caches par copie à l'écriture. Chaque worker
+réchauffe ses propres caches avant d'accepter la moindre connexion.
+
+Signaux du maître:
+    SIGHUP           rechargement progressif: le maître se réexécute (code et
+                     configuration relus) en gardant la socket, lance des
+                     workers réchauffés puis arrête gracieusement les anciens
+    SIGTERM, SIGINT  arrêt gracieux (les requêtes en cours se terminent)
+
+Réservé aux systèmes POSIX (fork).
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+logger = logging.getLogger('categories.serve')
+
+# Transmis au maître réexécuté lors d'un SIGHUP: socket d'écoute héritée et
+# workers de l'ancienne génération à arrêter
+LISTEN_FD_ENV = 'CATEGORIES_SERVE_FD'
+RETIRING_ENV = 'CATEGORIES_SERVE_RETIRING'
+
+# Routes appelées une fois par worker avant d'accepter du trafic
+WARM_URLS = ('/api/categories',)
+
+# Délai avant de remplacer un worker tombé, doublé à chaque crash consécutif
+RESPAWN_DELAY = 0.5
+RESPAWN_MAX_DELAY = 30.0
+# Un worker qui a tenu ce temps (en secondes) remet le délai à zéro
+RESPAWN_STABLE_AFTER = 10.0
+
+
+def warm_shared_caches():
+    """Caches chargés dans le maître et hérités par tous les workers"""
+    from database import category_index
+    from app import snapshots
+    category_index.load()
+    # Projection mémoire de l'instantané (CATALOG_SNAPSHOT), partagée après fork
+    snapshots.current()
+
+
+def warm_worker_caches(app):
+    """Caches propres au worker: connexion de lecture et pages les plus vues"""
+    import database
+    database.read_pool.release(database.read_pool.acquire())
+    client = app.test_client()
+    for url in WARM_URLS:
+        try:
+            response = client.get(url)
+        except Exception:
+            logger.exception('Échec du préchauffage de %s', url)
+            continue
+        if response.status_code != 200:
+            logger.warning('Préchauffage de %s: statut %d', url, response.status_code)
+
+
+def run_worker(sock, host, port):
+    from werkzeug.serving import make_server
+    from app import app, aggregator
+
+    warm_worker_caches(app)
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    # Attendre la fin des requêtes en cours lors de l'arrêt
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        # Compteurs signalés mais pas encore recalculés
+        aggregator.flush(timeout=5)
+    os._exit(0)
+
+
+class Master:
+    """Supervise les workers: redémarrage (avec recul) en cas de crash, reload, arrêt"""
+
+    def __init__(self, sock, host, port, workers):
+        self.sock = sock
+        self.host = host
+        self.port = port
+        self.size = workers
+        # pid -> instant du lancement
+        self.workers = {}
+        self.stopping = False
+        self.reload_requested = False
+        # Remplacements en attente (instants), crashs consécutifs
+        self.respawns = []
+        self.crashes = 0
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(self.sock, self.host, self.port)
+            except BaseException:
+                logger.exception('Worker %s arrêté sur erreur', os.getpid())
+            finally:
+                os._exit(1)
+        self.workers[pid] = time.monotonic()
+        return pid
+
+    def stop_workers(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.workers.pop(pid, None)
+
+    def schedule_respawn(self, started):
+        """Programme le remplacement d'un worker tombé, avec recul exponentiel"""
+        now = time.monotonic()
+        if now - started >= RESPAWN_STABLE_AFTER:
+            self.crashes = 0
+        delay = min(RESPAWN_DELAY * 2 ** self.crashes, RESPAWN_MAX_DELAY)
+        self.crashes += 1
+        self.respawns.append(now + delay)
+        return delay
+
+    def reload(self, retired):
+        """Réexécute le maître: les workers forkés ensuite chargent le nouveau code.
+
+        Les workers actuels (et ceux encore en cours d'arrêt) restent nos
+        enfants après exec; le nouveau maître les arrête une fois sa propre
+        génération lancée.
+        """
+        logger.info('Rechargement: réexécution du maître')
+        os.environ[LISTEN_FD_ENV] = str(self.sock.fileno())
+        os.environ[RETIRING_ENV] = ','.join(str(pid) for pid in set(self.workers) | retired)
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def run(self, retiring=()):
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, 'reload_requested', True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'stopping', True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, 'stopping', True))
+
+        for _ in range(self.size):
+            self.spawn()
+        logger.info('%d worker(s) sur http://%s:%d', self.size, self.host, self.port)
+
+        # Ancienne génération (après un SIGHUP): arrêtée une fois la relève lancée
+        retired = set(retiring)
+        for pid in retired:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        while True:
+            if self.stopping:
+                self.stop_workers(set(self.workers))
+                break
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload(retired)
+
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid:
+                started = self.workers.pop(pid, None)
+                if pid in retired:
+                    retired.discard(pid)
+                elif started is not None and not self.stopping:
+                    delay = self.schedule_respawn(started)
+                    logger.warning('Worker %d terminé, remplacement dans %.1f s', pid, delay)
+            else:
+                time.sleep(0.2)
+
+            now = time.monotonic()
+            for due in [due for due in self.respawns if due <= now]:
+                self.respawns.remove(due)
+                self.spawn()
+
+        # Workers et ancienne génération éventuellement encore en cours d'arrêt
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self.workers.pop(pid, None)
+        self.sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serveur de production multi-processus')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--init-db', action='store_true',
+                        help='crée les tables manquantes avant de démarrer')
+    parser.add_argument('--seed-sample-data', action='store_true',
+                        help='insère les données d\'exemple si la base est vide')
+    parser.add_argument('--rebuild-counts', action='store_true',
+                        help='reconstruit tous les compteurs de produits')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(process)d] %(levelname)s %(message)s')
+
+    listen_fd = os.environ.pop(LISTEN_FD_ENV, None)
+    retiring = [int(pid) for pid in os.environ.pop(RETIRING_ENV, '').split(',') if pid]
+
+    # Maintenance au premier démarrage seulement, pas à chaque rechargement
+    from database import init_db, create_sample_data, update_product_counts
+    if listen_fd is None:
+        if args.init_db or args.seed_sample_data:
+            init_db()
+        if args.seed_sample_data:
+            create_sample_data()
+        if args.rebuild_counts:
+            update_product_counts()
+
+    # Le maître importe l'application et charge les caches avant le fork:
+    # la socket n'est ouverte qu'une fois tout prêt
+    import app  # noqa: F401
+    warm_shared_caches()
+
+    if listen_fd is not None:
+        sock = socket.socket(fileno=int(listen_fd))
+    else:
+        family = socket.AF_INET6 if ':' in args.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((args.host, args.port))
+        sock.listen(args.backlog)
+    sock.set_inheritable(True)
+
+    Master(sock, args.host, sock.getsockname()[1], args.workers).run(retiring)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
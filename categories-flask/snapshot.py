@@ -0,0 +1,446 @@
+"""Instantané binaire du catalogue, en lecture seule et projeté en mémoire.
+
+    flask --app app export-snapshot catalog.snap
+
+Format (petit-boutiste); les positions sont relatives au début du fichier,
+sauf celles des noms, relatives au début de la table des noms:
+
+    en-tête         HEADER
+    JSON produits   objets JSON des produits dans l'ordre (name, id), séparés par ","
+    JSON catégories objets JSON des catégories dans l'ordre (level, name, id), idem
+    noms            table des noms UTF-8 (clés de tri)
+    catégories      enregistrements CATEGORY de taille fixe, ordre (level, name, id)
+    index id        positions (uint32) des catégories triées par id
+    produits        enregistrements PRODUCT de taille fixe, ordre (name, id)
+    index id        positions (uint32) des produits triés par id
+
+Les JSON sont exactement ceux des routes /api/categories et /api/products
+(mêmes requêtes, importées de queries.py): une liste complète ou une page est
+une seule tranche contiguë du fichier, servie sans décodage ni copie
+intermédiaire (tranches d'une memoryview). Les index par id servent les
+recherches d'une catégorie ou d'un produit. Le fichier est projeté avec mmap:
+tous les workers partagent les mêmes pages du cache du système.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from flask import Response
+from category_index import CategoryIndex
+from pagination import encode_cursor
+from queries import CATEGORIES_LISTING, PRODUCTS_LISTING
+from serializers import RowSerializer
+
+MAGIC = b'CATSNAP\x00'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<8sIIqqII12Q')
+# id, parent_id (-1 si aucun), level, product_count, nom (position dans la
+# table des noms, longueur), JSON (position dans le fichier, longueur)
+CATEGORY = struct.Struct('<qqiqQIQI')
+# id, category_id, price, nom (position, longueur), JSON (position, longueur)
+PRODUCT = struct.Struct('<qqdQIQI')
+INDEX = struct.Struct('<I')
+
+PRODUCTS_QUERY = PRODUCTS_LISTING.format(where='')
+CATEGORIES_QUERY = CATEGORIES_LISTING.format(where='')
+
+STREAM_CHUNK_BYTES = 1 << 20
+
+
+class SnapshotError(Exception):
+    pass
+
+
+# --- Export ---------------------------------------------------------------------
+
+def _dumps(obj):
+    # Même sortie que jsonify: clés triées, séparateurs compacts, ASCII
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'))
+
+
+class _Writer:
+    def __init__(self, f):
+        self.f = f
+        self.position = f.tell()
+
+    def write(self, data):
+        self.f.write(data)
+        self.position += len(data)
+
+
+def export_snapshot(conn, path):
+    """Écrit l'instantané du catalogue dans path (remplacement atomique).
+
+    Toutes les lectures se font dans une même transaction: l'instantané
+    correspond exactement à la version du catalogue enregistrée dans l'en-tête.
+    Renvoie l'en-tête sous forme de dict.
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    names = bytearray()
+    conn.execute('BEGIN')
+    try:
+        version = conn.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()[0]
+        categories_version = conn.execute(
+            "SELECT value FROM catalog_meta WHERE key = 'categories_version'").fetchone()[0]
+        index = CategoryIndex(None)
+        index.load(conn)
+
+        with open(tmp_path, 'wb') as f:
+            out = _Writer(f)
+            out.write(b'\0' * HEADER.size)
+
+            # JSON des produits, en flux
+            products_json_start = out.position
+            product_records = bytearray()
+            product_ids = array('q')
+            cursor = conn.execute(PRODUCTS_QUERY)
+            cursor.row_factory = None
+            serializer = RowSerializer(cursor.description)
+            id_at, category_at, price_at, name_at = (
+                serializer.index[column] for column in ('id', 'category_id', 'price', 'name'))
+            for position, row in enumerate(cursor):
+                if position:
+                    out.write(b',')
+                encoded = serializer.encode(row).encode('ascii')
+                name = row[name_at].encode('utf-8')
+                product_records += PRODUCT.pack(row[id_at], row[category_at], row[price_at],
+                                                len(names), len(name), out.position, len(encoded))
+                names += name
+                product_ids.append(row[id_at])
+                out.write(encoded)
+            products_json_end = out.position
+
+            categories_json_start = out.position
+            category_records = bytearray()
+            category_ids = array('q')
+            for position, row in enumerate(conn.execute(CATEGORIES_QUERY)):
+                if position:
+                    out.write(b',')
+                category = dict(row)
+                category['parentage'] = index.parentage(row['id'])
+                encoded = _dumps(category).encode('ascii')
+                name = row['name'].encode('utf-8')
+                parent_id = row['parent_id'] if row['parent_id'] is not None else -1
+                category_records += CATEGORY.pack(row['id'], parent_id, row['level'] or 1,
+                                                  row['product_count'] or 0, len(names), len(name),
+                                                  out.position, len(encoded))
+                names += name
+                category_ids.append(row['id'])
+                out.write(encoded)
+            categories_json_end = out.position
+
+            names_start = out.position
+            out.write(names)
+
+            category_records_start = out.position
+            out.write(category_records)
+            category_index_start = out.position
+            out.write(_id_index(category_ids))
+            product_records_start = out.position
+            out.write(product_records)
+            product_index_start = out.position
+            out.write(_id_index(product_ids))
+            size = out.position
+
+            header = {
+                'format_version': FORMAT_VERSION, 'catalog_version': version,
+                'categories_version': categories_version,
+                'categories': len(category_ids), 'products': len(product_ids),
+            }
+            f.seek(0)
+            f.write(HEADER.pack(
+                MAGIC, FORMAT_VERSION, 0, version, categories_version,
+                len(category_ids), len(product_ids),
+                products_json_start, products_json_end,
+                categories_json_start, categories_json_end,
+                names_start, category_records_start,
+                category_index_start, product_records_start, product_index_start,
+                size, 0, 0,
+            ))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return header
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        conn.rollback()
+
+
+def _id_index(ids):
+    """Positions des enregistrements triées par id, en uint32 petit-boutistes"""
+    index = array('I', sorted(range(len(ids)), key=ids.__getitem__))
+    if sys.byteorder == 'big':
+        index.byteswap()
+    return index.tobytes()
+
+
+# --- Lecture --------------------------------------------------------------------
+
+class _Table:
+    """Enregistrements de taille fixe et leur index par id.
+
+    key décrit la clé de tri des enregistrements: indices de champs, 'name'
+    désignant le nom (comparé en octets UTF-8, comme la collation BINARY).
+    view est une memoryview du fichier: ses tranches ne copient rien.
+    """
+
+    def __init__(self, buffer, view, record_struct, count, records_start, index_start,
+                 json_start, json_end, names_start, name_field, key):
+        self.buffer = buffer
+        self.view = view
+        self.names_start = names_start
+        self.name_field = name_field
+        self.key = key
+        self.record = record_struct
+        self.count = count
+        self.records_start = records_start
+        self.index_start = index_start
+        self.json_start = json_start
+        self.json_end = json_end
+
+    def unpack(self, position):
+        return self.record.unpack_from(self.buffer, self.records_start + position * self.record.size)
+
+    def name(self, values):
+        offset = self.names_start + values[self.name_field]
+        return self.buffer[offset:offset + values[self.name_field + 1]]
+
+    def sort_key(self, values):
+        return tuple(self.name(values) if field == 'name' else values[field]
+                     for field in self.key)
+
+    def json_range(self, start, stop):
+        """Tranche JSON (sans crochets) des enregistrements [start, stop), sans copie"""
+        if start >= stop:
+            return self.view[0:0]
+        first = self.unpack(start)
+        last = self.unpack(stop - 1)
+        return self.view[first[-2]:last[-2] + last[-1]]
+
+    def decode(self, position):
+        """Objet JSON de l'enregistrement à position, décodé"""
+        return json.loads(self.json_range(position, position + 1).tobytes())
+
+    def by_id(self, rank):
+        """Position de l'enregistrement de rang rank dans l'ordre des id"""
+        return INDEX.unpack_from(self.buffer, self.index_start + rank * INDEX.size)[0]
+
+    def find_id(self, record_id):
+        """Position de l'enregistrement d'identifiant record_id, ou None"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            position = self.by_id(middle)
+            current = self.unpack(position)[0]
+            if current == record_id:
+                return position
+            if current < record_id:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def bisect(self, key):
+        """Première position dont la clé de tri est strictement supérieure à key"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.sort_key(self.unpack(middle)) <= key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+class Snapshot:
+    """Instantané projeté en mémoire (mmap en lecture seule)"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if stat.st_size < HEADER.size:
+                raise SnapshotError(f'Instantané tronqué: {path}')
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, format_version, _, self.version, self.categories_version,
+         category_count, product_count,
+         products_json_start, products_json_end, categories_json_start, categories_json_end,
+         names_start, category_records, category_index, product_records, product_index,
+         size, _, _) = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise SnapshotError(f'Format d\'instantané inconnu: {path}')
+        if size != len(self.buffer):
+            raise SnapshotError(f'Instantané incomplet: {path}')
+
+        self.view = memoryview(self.buffer)
+        self.categories = _Table(self.buffer, self.view, CATEGORY, category_count,
+                                 category_records, category_index, categories_json_start,
+                                 categories_json_end, names_start, 4, (2, 'name', 0))
+        self.products = _Table(self.buffer, self.view, PRODUCT, product_count,
+                               product_records, product_index, products_json_start,
+                               products_json_end, names_start, 3, ('name', 0))
+        # Requêtes en cours qui utilisent l'instantané (SnapshotStore.acquire)
+        self.users = 0
+
+    def has_category(self, category_id):
+        return self.categories.find_id(category_id) is not None
+
+    def category(self, category_id):
+        """Catégorie d'identifiant category_id (dict avec parentage), ou None"""
+        position = self.categories.find_id(category_id)
+        if position is None:
+            return None
+        return self.categories.decode(position)
+
+    def categories_by_id(self, max_level=None):
+        """Catégories (dicts avec parentage) par id croissant, de niveau < max_level"""
+        table = self.categories
+        for rank in range(table.count):
+            position = table.by_id(rank)
+            if max_level is None or table.unpack(position)[2] < max_level:
+                yield table.decode(position)
+
+    def close(self):
+        """Libère la projection; BufferError tant qu'une réponse en flux en lit une tranche"""
+        self.view.release()
+        self.buffer.close()
+
+
+def _chunks(view):
+    # WSGI n'accepte que des bytes: chaque morceau (au plus STREAM_CHUNK_BYTES)
+    # est copié une seule fois, au moment d'être écrit
+    for offset in range(0, len(view), STREAM_CHUNK_BYTES):
+        yield view[offset:offset + STREAM_CHUNK_BYTES].tobytes()
+
+
+def listing_response(table, page):
+    """Réponse de /api/categories ou /api/products lue dans l'instantané.
+
+    Mêmes curseurs et même JSON que la lecture en base: une page ou la liste
+    complète est une tranche contiguë du fichier, envoyée par morceaux sans
+    être assemblée en mémoire. Lève ValueError si le curseur ne correspond
+    pas à la clé de tri.
+    """
+    start = 0
+    if page.after is not None:
+        try:
+            start = table.bisect(tuple(value.encode('utf-8') if isinstance(value, str) else value
+                                       for value in page.after))
+        except TypeError:
+            raise ValueError('Curseur invalide')
+
+    if page.stream or not page.paginated:
+        first = table.unpack(start)[-2] if start < table.count else table.json_end
+        items = table.view[first:table.json_end]
+        prefix, suffix = b'[', b']' if page.stream else b']\n'
+    else:
+        stop = min(start + page.limit, table.count)
+        next_cursor = None
+        if stop < table.count:
+            key = table.sort_key(table.unpack(stop - 1))
+            next_cursor = encode_cursor([value.decode('utf-8') if isinstance(value, bytes) else value
+                                         for value in key])
+        items = table.json_range(start, stop)
+        prefix = b'{"items":['
+        suffix = b'],"next_cursor":' + _dumps(next_cursor).encode('ascii') + b'}\n'
+
+    def generate():
+        yield prefix
+        yield from _chunks(items)
+        yield suffix
+
+    response = Response(generate(), mimetype='application/json')
+    response.content_length = len(prefix) + len(items) + len(suffix)
+    return response
+
+
+class SnapshotStore:
+    """Instantané courant, rechargé à chaud quand le fichier est remplacé.
+
+    Le fichier n'est réexaminé (stat) qu'une fois par check_interval secondes.
+    Un instantané remplacé est fermé dès qu'aucune requête (acquire/release)
+    ni réponse en flux ne le lit plus.
+    """
+
+    def __init__(self, path=None, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._retired = []
+        self._checked_at = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def current(self):
+        if not self.path:
+            return None
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._snapshot
+        with self._lock:
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                self._refresh()
+        return self._snapshot
+
+    def acquire(self):
+        """Instantané courant réservé pour une requête (à rendre par release), ou None"""
+        self.current()
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None:
+                snapshot.users += 1
+            return snapshot
+
+    def release(self, snapshot):
+        with self._lock:
+            snapshot.users -= 1
+            self._close_retired()
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._retire(None)
+            return
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if self._snapshot is not None and self._snapshot.identity == identity:
+            return
+        try:
+            snapshot = Snapshot(self.path)
+        except (OSError, SnapshotError, struct.error):
+            # Fichier en cours de remplacement ou invalide: on garde l'ancien
+            return
+        self._retire(snapshot)
+
+    def _retire(self, replacement):
+        if self._snapshot is not None:
+            self._retired.append(self._snapshot)
+        self._snapshot = replacement
+        self._close_retired()
+
+    def _close_retired(self):
+        still_open = []
+        for snapshot in self._retired:
+            if snapshot.users:
+                still_open.append(snapshot)
+                continue
+            try:
+                snapshot.close()
+            except BufferError:
+                # Une réponse en flux en lit encore une tranche: nouvel essai plus tard
+                still_open.append(snapshot)
+        self._retired = still_open
@@ -0,0 +1,120 @@
+"""Déplacement et suppression en cascade de sous-arbres de catégories.
+
+Les deux opérations travaillent dans la transaction d'écriture de l'appelant
+et ne touchent que le sous-arbre et les chaînes d'ancêtres concernées:
+niveaux, table de fermeture et facettes de prix. Les compteurs product_count
+des ancêtres restent à la charge de l'appelant (deltas ou worker
+d'agrégation), comme pour les autres écritures. Le journal des modifications
+et l'index de recherche suivent par triggers; un déplacement republie en plus
+tout le sous-arbre, dont la parenté change.
+
+parent_id ne doit être modifié que par move_subtree(): aucun trigger ne
+maintient la table de fermeture sur UPDATE.
+"""
+import json
+from changes import republish
+from facets import attach_subtree_facets, detach_subtree_facets
+
+MAX_LEVEL = 3
+
+
+def subtree_ids(conn, category_id):
+    """Identifiants du sous-arbre (catégorie comprise), du haut vers le bas"""
+    return [row[0] for row in conn.execute(
+        'SELECT descendant FROM category_closure WHERE ancestor = ? ORDER BY depth',
+        (category_id,)
+    )]
+
+
+def subtree_height(conn, category_id):
+    """Nombre de niveaux sous la catégorie (0 pour une feuille)"""
+    return conn.execute('SELECT MAX(depth) FROM category_closure WHERE ancestor = ?',
+                        (category_id,)).fetchone()[0] or 0
+
+
+def _detach_closure(conn, category_id):
+    # Liens entre les ancêtres stricts et tout le sous-arbre
+    conn.execute('''
+        DELETE FROM category_closure
+        WHERE descendant IN (SELECT descendant FROM category_closure WHERE ancestor = :id)
+          AND ancestor IN (SELECT ancestor FROM category_closure
+                           WHERE descendant = :id AND depth > 0)
+    ''', {'id': category_id})
+
+
+def check_move(conn, category_id, parent_id):
+    """Message d'erreur si le déplacement est interdit, sinon None"""
+    if parent_id is None:
+        level = 1
+    else:
+        parent = conn.execute('SELECT level FROM categories WHERE id = ?',
+                              (parent_id,)).fetchone()
+        if parent is None:
+            return 'Catégorie parent introuvable'
+        if conn.execute('SELECT 1 FROM category_closure WHERE ancestor = ? AND descendant = ?',
+                        (category_id, parent_id)).fetchone():
+            return 'Référence circulaire: le parent est dans le sous-arbre déplacé'
+        level = parent[0] + 1
+    if level + subtree_height(conn, category_id) > MAX_LEVEL:
+        return f'Maximum {MAX_LEVEL} niveaux de catégories autorisés'
+    return None
+
+
+def move_subtree(conn, category_id, parent_id):
+    """Rattache category_id (et ses descendants) à parent_id, None pour la racine.
+
+    Le déplacement doit avoir été validé par check_move(). Renvoie les
+    identifiants du sous-arbre.
+    """
+    detach_subtree_facets(conn, category_id)
+    _detach_closure(conn, category_id)
+    conn.execute('''
+        INSERT INTO category_closure (ancestor, descendant, depth)
+        SELECT sup.ancestor, sub.descendant, sup.depth + sub.depth + 1
+        FROM category_closure sup, category_closure sub
+        WHERE sup.descendant = ? AND sub.ancestor = ?
+    ''', (parent_id, category_id))
+
+    conn.execute('UPDATE categories SET parent_id = ? WHERE id = ?', (parent_id, category_id))
+    base = 1 if parent_id is None else conn.execute(
+        'SELECT level + 1 FROM categories WHERE id = ?', (parent_id,)).fetchone()[0]
+    conn.execute('''
+        UPDATE categories SET level = ? + cc.depth
+        FROM category_closure cc
+        WHERE cc.ancestor = ? AND categories.id = cc.descendant
+    ''', (base, category_id))
+
+    attach_subtree_facets(conn, category_id)
+    ids = subtree_ids(conn, category_id)
+    # Même à niveau égal, la parenté des descendants change: le trigger de
+    # mise à jour (gardé par comparaison des colonnes) ne les journalise pas
+    republish(conn, 'category', ids)
+    return ids
+
+
+def delete_subtree(conn, category_id):
+    """Supprime category_id, ses descendants et tous leurs produits.
+
+    Renvoie (identifiants des catégories supprimées, nombre de produits
+    supprimés).
+    """
+    ids = subtree_ids(conn, category_id)
+    if not ids:
+        return [], 0
+    subtree = json.dumps(ids)
+
+    detach_subtree_facets(conn, category_id)
+    _detach_closure(conn, category_id)
+    # Facettes du sous-arbre supprimées d'abord: les triggers de suppression
+    # des produits ne trouvent plus rien à mettre à jour
+    conn.execute('DELETE FROM category_price_stats '
+                 'WHERE category_id IN (SELECT value FROM json_each(?))', (subtree,))
+    conn.execute('DELETE FROM category_price_buckets '
+                 'WHERE category_id IN (SELECT value FROM json_each(?))', (subtree,))
+
+    products = conn.execute('DELETE FROM products '
+                            'WHERE category_id IN (SELECT value FROM json_each(?))',
+                            (subtree,)).rowcount
+    conn.execute('DELETE FROM categories WHERE id IN (SELECT value FROM json_each(?))',
+                 (subtree,))
+    return ids, products
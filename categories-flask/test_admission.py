@@ -0,0 +1,43 @@
+"""Le contrôle d'admission ne laisse jamais plus de max_concurrency requêtes en cours.
+
+    python -m pytest test_admission.py
+"""
+import threading
+import pytest
+from admission import AdmissionController, Overloaded
+
+
+def test_reads_rejected_while_writes_fill_the_slots():
+    controller = AdmissionController(max_concurrency=4, write_reserved=1, queue_timeout=0.05)
+    for _ in range(4):
+        controller.acquire('/api/product', write=True)
+
+    with pytest.raises(Overloaded):
+        controller.acquire('/api/products')
+    with pytest.raises(Overloaded):
+        controller.acquire('/api/product', write=True)
+    assert controller.stats()['reads'] == 0
+
+
+def test_queued_read_admitted_once_writes_leave_room():
+    controller = AdmissionController(max_concurrency=4, write_reserved=1, queue_timeout=5)
+    for _ in range(3):
+        controller.acquire('/api/product', write=True)
+
+    admitted = threading.Event()
+
+    def read():
+        controller.acquire('/api/products')
+        admitted.set()
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    # 3 écritures en cours: aucune place de lecture (4 - 1 réservée)
+    assert not admitted.wait(0.1)
+    assert controller.stats()['queued']['read'] == 1
+
+    controller.release('/api/product', write=True)
+    reader.join(1)
+    assert admitted.is_set()
+    stats = controller.stats()
+    assert stats['reads'] + stats['writes'] == 3
@@ -0,0 +1,22 @@
+"""Les requêtes chaudes doivent passer par un index sur une base neuve.
+
+    python -m pytest test_query_plans.py
+"""
+import pytest
+import database
+from migrations import HOT_QUERIES, check_query_plans
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'categories.db'))
+    database.init_db()
+    conn = database.get_db_connection()
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('query', HOT_QUERIES, ids=[query[0] for query in HOT_QUERIES])
+def test_hot_query_uses_index(conn, query):
+    [(name, plan, problems)] = check_query_plans(conn, [query])
+    assert problems == [], f'{name}: {plan}'